@@ -0,0 +1,198 @@
+#!/usr/bin/python3
+"""
+Timings of materialize, layout and paint for some synthetic trees.
+
+Run as `./benchmark.py [name...]`, with no names runs all of them.
+"""
+
+import io
+import sys
+import time
+
+from retui import layoutstore
+from retui.component import Component, Scrollable
+from retui.document import Document
+from retui.renderer import Renderer
+from retui.widgets import div, span
+
+
+class BenchmarkRenderer(Renderer):
+    def __init__(self):
+        super().__init__()
+        self.stdout = io.StringIO()
+
+    def flush(self):
+        super().flush()
+        self.stdout.seek(0)
+        self.stdout.truncate()
+
+
+class Leaf(Component):
+    state = {"count": 0}
+
+    def render(self):
+        return f"Count {self.state['count']}"
+
+
+def deep_tree(depth):
+    leaf = Leaf()
+    tree = leaf
+    for n in range(depth):
+        tree = div(className="bg-primary" if n % 2 else None)[tree]
+    return Document(renderer=BenchmarkRenderer())[tree], leaf
+
+
+def timeit(label, func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<24} {best * 1000:9.2f} ms")
+
+
+def bench_deep():
+    """
+    A chain of nested divs, as generated tree views or nested dialogs.
+    """
+    for depth in (500, 1000, 2000):
+        print(f"deep tree, depth {depth}:")
+        app, leaf = deep_tree(depth)
+        app.materialize()
+        renderer = app.renderer
+
+        def full_layout():
+            for item in app.preorderTraversal():
+                item.layoutDirty = True
+            app.calculateLayout()
+
+        text = leaf.children[0]
+
+        def text_change():
+            text.props["text"] += "."
+            text.setLayoutDirty()
+            app.calculateLayout()
+
+        def render_all():
+            for item in app.preorderTraversal():
+                item.setChanged()
+            app.materialize()
+
+        def leaf_render():
+            leaf.setState({"count": leaf.state["count"] + 1})
+            app.materialize()
+
+        timeit("render all", render_all)
+        timeit("render the leaf", leaf_render)
+        timeit("full layout", full_layout)
+        timeit("layout after a change", text_change)
+        timeit("paint", lambda: Component.paint(app, renderer))
+
+
+def bench_wide():
+    """
+    A long flat list, as a table, with and without a LayoutStore.
+    """
+    for rows in (1000, 10000):
+        for store in (None, layoutstore.LayoutStore()):
+            name = "Layout objects" if store is None else "LayoutStore"
+            if store and store.vectorize:
+                name += " + numpy"
+            print(f"wide list, {rows} rows, {name}:")
+            layoutstore.useLayoutStore(store)
+            app = Document(renderer=BenchmarkRenderer())[
+                div()[[span()[f"Row {n}"] for n in range(rows)]]
+            ]
+            app.materialize()
+
+            def full_layout():
+                for item in app.preorderTraversal():
+                    item.layoutDirty = True
+                app.calculateLayout()
+
+            timeit("full layout", full_layout)
+            timeit("positions", app.calculateLayoutPosition)
+    layoutstore.useLayoutStore(None)
+
+
+def bench_scroll():
+    """
+    A long list inside a Scrollable, scrolled to the middle.
+    """
+    for rows in (1000, 5000, 100000):
+        print(f"scrolled list, {rows} rows:")
+        scroll = Scrollable()[[div()[f"Row {n}"] for n in range(rows)]]
+        app = Document(renderer=BenchmarkRenderer())[scroll]
+        app.materialize()
+        scroll.scrollTo(0, rows // 2)
+        app.calculateLayout()
+        renderer = app.renderer
+
+        timeit("paint", lambda: Component.paint(app, renderer))
+
+        def full_layout():
+            for item in app.preorderTraversal():
+                item.layoutDirty = True
+            app.calculateLayout()
+
+        def scroll_down():
+            scroll.scrollTo(0, scroll.scrollY + scroll.layout.height)
+            Component.paint(app, renderer)
+
+        timeit("full layout", full_layout)
+        timeit("scroll a page down", scroll_down)
+
+
+class Row(Component):
+    def render(self):
+        return f"Row {self.props['n']}"
+
+
+class List(Component):
+    def render(self):
+        keyed = self.props["keyed"]
+        return div()[
+            [Row(n=n, key=n if keyed else None) for n in self.state["rows"]]
+        ]
+
+
+def bench_insert():
+    """
+    Rows inserted at the head of a long list, with and without keys.
+    """
+    for rows in (1000, 10000):
+        for keyed in (False, True):
+            name = "keyed" if keyed else "not keyed"
+            print(f"insert at head, {rows} rows, {name}:")
+            items = List(keyed=keyed)
+            items.state = {"rows": list(range(rows))}
+            app = Document(renderer=BenchmarkRenderer())[items]
+            app.materialize()
+            app.calculateLayout()
+
+            def insert():
+                first = items.state["rows"][0]
+                items.setState({"rows": [first - 1, *items.state["rows"]]})
+                app.materialize()
+                app.calculateLayout()
+
+            timeit("insert and layout", insert)
+            print(f"  {'components rendered':<24} {app.renderCount:9d}")
+
+
+BENCHMARKS = {
+    "deep": bench_deep,
+    "wide": bench_wide,
+    "scroll": bench_scroll,
+    "insert": bench_insert,
+}
+
+
+def main(names):
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,14 +1,55 @@
+import bisect
 from dataclasses import dataclass
+import functools
 import itertools
 import logging
 import math
 
-from retui import css
+from retui import css, layoutstore
 from .events import EventKeyPress, HandleEventTrait
 from .renderer import Renderer
 
 logger = logging.getLogger(__name__)
 
+# props that change which rules apply to a component
+STYLE_PROPS = ("className", "id", "style")
+# max height for Scrollable content, as if there were no limit
+UNBOUNDED = 2**31 - 1
+# sizes over this are UNBOUNDED minus some padding: nothing to grow into
+INDEFINITE = UNBOUNDED // 2
+# Scrollable measures exactly the rows this many viewports around the visible one
+SCROLL_MEASURE_MARGIN = 1
+
+
+@functools.lru_cache(maxsize=256)
+def trackSizes(tracks: tuple, available: int, used: int = 0) -> tuple[int, ...]:
+    """
+    Sizes of the grid tracks in the available space: fixed cells,
+    percentages of it, and fr shares of what the others leave.
+
+    Auto tracks are 0 here, their size is the content one, `used` in total.
+    Cached, as the templates and sizes rarely change between frames.
+    """
+    sizes = []
+    fractions = 0
+    for kind, value in tracks:
+        if kind == "cells":
+            sizes.append(value)
+        elif kind == "percent":
+            sizes.append(available * value // 100)
+        else:
+            if kind == "fr":
+                fractions += value
+            sizes.append(0)
+    free = available - used - sum(sizes)
+    if fractions and free > 0:
+        quant_size = free / fractions
+        sizes = [
+            math.floor(quant_size * value) if kind == "fr" else size
+            for (kind, value), size in zip(tracks, sizes)
+        ]
+    return tuple(sizes)
+
 
 @dataclass
 class Layout:
@@ -16,6 +57,8 @@ class Layout:
     y: int = 0
     width: int = 0
     height: int = 0
+    # (min_width, min_height, max_width, max_height) it was measured with
+    constraints: tuple = None
 
     def inside(self, x, y):
         return (self.x <= x < (self.x + self.width)) and (
@@ -31,6 +74,9 @@ class Component:
     Props:
     * style -- Dict of styles | another component to get styles from it. See select
     * className - List of classnames
+    * dormant - Keeps the component, its state and children, but it is not
+      rendered again, laid out, painted nor found, as an inactive tab.
+      As display: none, but that one is still rendered.
     """
 
     serialid = 0  # just for debugging, to ensure materialize reuses as possible
@@ -41,11 +87,38 @@ class Component:
     document = None
     key = None
     layout: Layout = None
+    # if set, layouts are views into it. See retui.layoutstore
+    layoutStore: layoutstore.LayoutStore = None
     children: list = None
+    # style as resolved from the stylesheet, inline style and parent. See getComputedStyle
+    computedStyle: css.ComputedStyle = None
+    # style before invalidateStyle, to know if the new one needs a new layout
+    previousStyle: css.ComputedStyle = None
+    # some descendant needs its style recalculated
+    styleDirtyDescendants: bool = False
+    # all the descendants need their style recalculated
+    styleDirtySubtree: bool = False
+    # bloom filter of the parents names, ids and classes. See getAncestorFilter
+    ancestorFilter: int = None
+    # (computedStyle, stylePass, {key: (style prop, ComputedStyle)}) to share styles
+    # between similar children. Only for one calculateStyles pass, so it does not grow
+    childStyleCache: tuple = None
+    # the size of this component, or of some descendant, must be calculated again
+    layoutDirty: bool = True
+    # measureKey and resulting size of the layout constraints. See measure
+    measuredKey: tuple = None
+    measuredSize: tuple = None
+    # (column sizes, row sizes) of the last layout, if display is grid
+    gridTracks: tuple = None
+    # some descendant is absolute positioned, so may be outside this layout
+    overflows: bool = False
     # where to position the cursor relative to the parent, if focused
     # if exists, good, if not, checks parent
     # cursor: tuple[int, int] = (0, 0)
 
+    # components rendered at the last materialize from this one
+    renderCount: int = 0
+
     __mounted: bool = False
     __changed: bool = True
 
@@ -56,14 +129,18 @@ class Component:
         if style and isinstance(style, dict):
             props = {**props, "style": css.StyleSheet.normalizeStyle(props["style"])}
         self.props = props
+        if "key" in props:
+            self.key = props["key"]
         Component.serialid += 1
         self.serialid = Component.serialid
-        self.layout = Layout()
+        store = self.layoutStore
+        self.layout = Layout() if store is None else store.view()
         self.children = children or []
         super().__init__()
 
     def __getitem__(self, children: list):
         self.props["children"] = children
+        self.setChanged()
         return self
 
     def __repr__(self):
@@ -86,20 +163,133 @@ class Component:
         return self.props.get("children", [])
 
     def paint(self, renderer: Renderer):
-        zIndex = self.getStyle("zIndex")
+        """
+        Paints this component and all its descendants.
+
+        Uses an explicit stack instead of recursion, so very deep trees
+        do not reach the recursion limit. See paintSteps.
+
+        Subtrees out of the current clipping are not painted at all, as
+        the rows of a long Scrollable out of view.
+
+        If the renderer keeps the owner of each cell, each component marks
+        where it is visible, for findElementAt.
+        """
+        owners = renderer.owners is not None
+        stack = [self]
+        try:
+            while stack:
+                item = stack.pop()
+                if isinstance(item, Component):
+                    if item.isHidden() or item.isOffscreen(renderer):
+                        continue
+                    if owners:
+                        layout = item.layout
+                        zIndex = renderer.zIndex
+                        if not isinstance(item, Text):  # as at paintSteps
+                            zIndex += item.getComputedStyle().zIndex or 0
+                        renderer.setOwner(
+                            item,
+                            layout.x,
+                            layout.y,
+                            layout.width,
+                            layout.height,
+                            zIndex,
+                        )
+                    steps = item.paintSteps(renderer)
+                    if steps is None:  # all painted at once
+                        continue
+                    children = next(steps, None)
+                    if children is item.children:
+                        children = item.visibleChildren(renderer)
+                else:
+                    steps = item
+                    children = next(steps, None)
+                if children is None:  # finished
+                    continue
+                stack.append(steps)
+                stack.extend(reversed(children))
+        finally:
+            # on errors, let the parents pop their clippings
+            for item in reversed(stack):
+                if not isinstance(item, Component):
+                    item.close()
+
+    def paintSteps(self, renderer: Renderer):
+        """
+        Paints this component. Yields the children to paint in between,
+        and continues after they are painted.
+
+        Components without children to paint may just paint and return.
+        """
+        zIndex = self.getComputedStyle().zIndex
         if zIndex is not None:
             renderer.addZIndex(zIndex)
-        for child in self.children:
-            child.paint(renderer)
+        yield self.children
         if zIndex is not None:
             renderer.addZIndex(-zIndex)
 
+    def isOffscreen(self, renderer: Renderer):
+        """
+        If this component, and so its descendants, can not paint inside
+        the renderer clipping.
+        """
+        if self.overflows:
+            return False
+        layout = self.layout
+        tx, ty = renderer.translate
+        (left, top), (right, bottom) = renderer.clipping
+        x = layout.x + tx
+        y = layout.y + ty
+        return (
+            x >= right
+            or y >= bottom
+            or x + layout.width <= left
+            or y + layout.height <= top
+        )
+
+    def visibleChildren(self, renderer: Renderer):
+        """
+        The children that may paint inside the renderer clipping.
+
+        As in a flow they go one after the other, the first and last
+        visible ones are searched, without checking all of them.
+        """
+        children = self.children
+        style = self.getComputedStyle()
+        if self.overflows or style.display == "grid" or len(children) < 2:
+            return children
+        tx, ty = renderer.translate
+        (left, top), (right, bottom) = renderer.clipping
+        if style.flexDirection == "row":
+            start = bisect.bisect_right(
+                children,
+                left - tx,
+                key=lambda child: child.layout.x + child.layout.width,
+            )
+            end = bisect.bisect_left(
+                children, right - tx, start, key=lambda child: child.layout.x
+            )
+        else:
+            start = bisect.bisect_right(
+                children,
+                top - ty,
+                key=lambda child: child.layout.y + child.layout.height,
+            )
+            end = bisect.bisect_left(
+                children, bottom - ty, start, key=lambda child: child.layout.y
+            )
+        return children[start:end]
+
     def setChanged(self):
-        if self.__changed:
-            return
+        """
+        This component must render again. It is queued at the document,
+        so materialize goes directly to it. See Document.materialize
+        """
         self.__changed = True
-        if self.parent:
-            self.parent.setChanged()
+        document = self.document
+        if document is not None:
+            document.renderQueue.add(self)
 
     def setState(self, update):
         # logger.debug("Update state %s: %s", self, update)
@@ -107,19 +297,27 @@ class Component:
             self.state = {}
 
         self.state = {**self.state, **update}
+        document = self.document
+        if document is not None and document.batchUpdates:
+            # at the end of the batch, once. See Document.batch
+            document.pendingUpdates.add(self)
+            return
         self.setChanged()
+        self.setLayoutDirty()
 
     def normalize(self, nodes):
         """
         Helper to return always some component, normally translating
         strings to Text nodes.
+
+        Only this level: the children of the children are normalized when
+        those render.
         """
         if not isinstance(nodes, (list, tuple)):
             nodes = [nodes]
         ret = []
         for item in nodes:
             if isinstance(item, Component):
-                item.props["children"] = self.normalize(item.props.get("children", []))
                 ret.append(item)
             elif item is True:
                 ret.append(Text(text=True))
@@ -130,9 +328,45 @@ class Component:
         return ret
 
     def materialize(self):
-        if not self.__changed:
-            return
+        """
+        Renders the changed components, and reconciles the result with
+        the current children.
+
+        Only the changed components render: this one, and the children
+        the parent renders with other props, and so on. renderCount tells
+        how many rendered.
+
+        Parents are rendered first, and mounted after their children. It
+        does not recurse, for very deep trees.
+        """
+        rendered = 0
+        # (component, mount): if mount, the children are already materialized
+        stack = [(self, False)]
+        while stack:
+            item, mount = stack.pop()
+            if mount:
+                item.__mounted = True
+                item.componentDidMount()
+                continue
+            if item is not self and item.props.get("dormant"):
+                # keeps the current children, and changes, until awaken
+                continue
+            if not item.__changed:
+                continue
+            item.__changed = False
 
+            item.materializeChildren()
+            rendered += 1
+            # logger.debug("Materialized %s -> %s", item,
+            #              item.children)
+            if not item.__mounted:
+                stack.append((item, True))
+            stack.extend((child, False) for child in reversed(item.children))
+
+        self.renderCount = rendered
+        return self
+
+    def materializeChildren(self):
         children = self.normalize(self.render())
 
         if self.children is None:
@@ -142,64 +376,110 @@ class Component:
             self.children = children
         else:
             nextchildren = self.reconcile(self, self.children, children)
+            if len(nextchildren) != len(self.children) or any(
+                a is not b for a, b in zip(nextchildren, self.children)
+            ):
+                self.setLayoutDirty()
+                kept = set(map(id, nextchildren))
+                for child in self.children:
+                    if id(child) not in kept:
+                        child.document = None  # removed, see Document.materialize
 
             self.children = nextchildren
 
-        # logger.debug("Materialized %s -> %s", self,
-        #              self.children)
-        # rec materialize
-        for child in self.children:
-            child.materialize()
-
-        if not self.__mounted:
-            self.__mounted = True
-            self.componentDidMount()
+    def setLayoutDirty(self):
+        """
+        Something that changes the layout changed: props, state, children
+        or a layout style.
 
-        return self
+        The parents sizes may depend on ours, so they are marked too, up
+        to a relayout boundary, whose size does not depend on its children.
+        That one is calculated again alone at Document.calculateLayout.
+        """
+        document = self.document
+        node = self
+        while True:
+            node.layoutDirty = True
+            parent = node.parent
+            if parent is None or node.isRelayoutBoundary():
+                if document:
+                    document.layoutRoots.add(node)
+                    document.layoutPending = True
+                return
+            if parent.layoutDirty:
+                # already marked up to its boundary
+                return
+            node = parent
+
+    def isRelayoutBoundary(self):
+        """
+        If the parent layout does not depend on our size: fixed width and
+        height, or absolute positioned.
+        """
+        style = self.computedStyle
+        if style is None:
+            return False
+        width = style.width
+        height = style.height
+        if (
+            width
+            and height
+            and width[0] == "cells"
+            and height[0] == "cells"
+            and width[1] > 0
+            and height[1] > 0
+        ):
+            return True
+        if style.position == "absolute":
+            # at rows, absolute children still take their width
+            parentStyle = self.parent and self.parent.computedStyle
+            return parentStyle is not None and parentStyle.flexDirection != "row"
+        return False
 
     def reconcile(self, parent, leftchildren, rightchildren):
-        # logger.debug("Reconcile two lists: %s <-> %s",
-        #              leftchildren, rightchildren)
+        """
+        Reuses the left children that are equivalent to the right ones.
+
+        Children with a key are paired by key wherever they are now, so
+        they keep their state when others are inserted, removed or moved
+        around them. The ones without are paired in order.
+
+        Only this level: the reused ones get the right props, and render
+        again with them if changed.
+        """
+        keyed = {}
+        unkeyed = []
+        for left in leftchildren:
+            if left.key is None:
+                unkeyed.append(left)
+            elif left.key not in keyed:
+                keyed[left.key] = left
+        unkeyed.reverse()
+
         nextchildren = []
-        for left, right in itertools.zip_longest(leftchildren, rightchildren):
-            # print("materialize iseq", left, right)
-            # logger.debug("is eq: %s %s", left, right)
+        for right in rightchildren:
+            if right.key is None:
+                left = unkeyed.pop() if unkeyed else None
+            else:
+                left = keyed.pop(right.key, None)
             if self.isEquivalent(left, right):
-                # logger.debug("Materialize reconcile: %s ~ %s", left, right)
                 left.updateProps(right)
                 nextchildren.append(left)
-                left.props["children"] = self.reconcile(
-                    left,
-                    left.props.get("children") or [],
-                    right.props.get("children") or [],
-                )
-            elif right:
-                # logger.debug(
-                #     "Materialize reconcile: %s != %s", left, right)
+            else:
+                # first use of right, mounted after it materializes
                 nextchildren.append(right)
-                # first use of right, so mount
-                right.parent = parent
-                right.document = parent and parent.document
-                if not right.__mounted:
-                    right.__mounted = False
-                    right.componentDidMount()
-
-        nextchildren = [x for x in nextchildren if x]
+
         for child in nextchildren:
-            if child.parent != parent:
+            if child.parent is not parent:
                 child.parent = parent
-                child.document = self.document
+                child.document = parent.document
+                child.invalidateStyle()
         return nextchildren
 
     def isEquivalent(self, left, right):
-        if not left or not right:
+        if left is None:
             return False
-        if left.name == right.name:
-            return True
-        if left.key and left.key == right.key:
-            return True
-
-        return False
+        return left.name == right.name and left.key == right.key
 
     def isFocusable(self):
         if not isinstance(self, HandleEventTrait):
@@ -212,12 +492,34 @@ class Component:
     def updateProps(self, other):
         # logger.debug("%s Update props: %s from %s",
         #              self, self.props, other.props)
+        if other is self:
+            return
+        dormant = self.props.get("dormant")
         deleted_props = set(self.props.keys()) - set(other.props.keys())
         for key in deleted_props:
             del self.props[key]
+        if deleted_props:
+            self.__changed = True
+            self.setLayoutDirty()
+        for key in STYLE_PROPS:
+            if key in deleted_props or self.props.get(key) != other.props.get(key):
+                # with "a b" like rules, children may match different rules now
+                document = self.document
+                subtree = (
+                    key != "style"
+                    and document is not None
+                    and document.stylesheet.hasAncestorRules
+                )
+                self.invalidateStyle(subtree=subtree)
+                break
 
         for key, val in other.props.items():
             oldval = self.props.get(key)
+            if oldval != val and key[:3] != "on_":
+                # the parent is rendering, and will materialize this one next
+                self.__changed = True
+                if key != "children":
+                    self.setLayoutDirty()
             if not oldval:
                 self.props[key] = val
                 continue
@@ -229,15 +531,16 @@ class Component:
             # logger.debug("Replace props: %s", key)
             self.props[key] = val
 
+        document = self.document
+        if dormant and not self.props.get("dormant") and document is not None:
+            document.wakeDormant()
+
     def queryElement(self, query: css.Selector | str):
         if isinstance(query, str):
             query = css.Selector(query)
-        if query.match(self):
-            return self
-        for child in self.children:
-            ret = child.queryElement(query)
-            if ret:
-                return ret
+        for item in self.preorderTraversal():
+            if query.match(item):
+                return item
 
     def queryParent(self, query: css.Selector | str):
         """
@@ -253,10 +556,14 @@ class Component:
                 return ret
         return None
 
-    def preorderTraversal(self):
-        yield self
-        for child in self.children:
-            yield from child.preorderTraversal()
+    def preorderTraversal(self, skipHidden=False):
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if skipHidden and item.isHidden():
+                continue
+            yield item
+            stack.extend(reversed(item.children))
 
     def parentTraversal(self):
         el = self
@@ -268,104 +575,376 @@ class Component:
         """
         Finds which element is at that position.
         """
-        zIndex = (self.getStyle("zIndex") or 0) + z
-        ret = (-1, None)
-        if self.layout.inside(x, y):
-            ret = (zIndex, self)
-
-        for child in self.children:
-            rc = child.findElementAt(x, y, zIndex)
-            if rc[0] >= ret[0]:
+        ret = None
+        stack = [(self, z)]
+        while stack:
+            item, zIndex = stack.pop()
+            if item.isHidden():
+                continue
+            zIndex = (item.getComputedStyle().zIndex or 0) + zIndex
+            # on same zIndex, the last one in preorder
+            if item.layout.inside(x, y):
+                rc = (zIndex, item)
+            else:
+                rc = (-1, None)
+            if ret is None or rc[0] >= ret[0]:
                 ret = rc
+            stack.extend((child, zIndex) for child in reversed(item.children))
         return ret
 
-    def getStyle(self, csskey: css.StyleProperty, default=None):
-        style = self.props.get("style", {})
-        # allow refer style to another component
+    def isHidden(self):
+        """
+        If display is none, or it is dormant. Hidden subtrees take no space,
+        and are skipped at layout, paint, findElementAt and focus changes.
+        """
+        return bool(self.props.get("dormant")) or (
+            self.getComputedStyle().display == "none"
+        )
+
+    def getComputedStyle(self) -> css.ComputedStyle:
+        """
+        Resolves all the style properties at once, inherited ones included,
+        and caches them until invalidateStyle is called.
+
+        Normally all are already resolved by Document.calculateStyles, but
+        new components or components outside the document are resolved here.
+        """
+        document = self.document
+        if document and document.stylesPending:
+            document.calculateStyles()
+        computed = self.computedStyle
+        if computed is None:
+            style = self.props.get("style")
+            # allow refer style to another component
+            if isinstance(style, Component):
+                return style.getComputedStyle()
+
+            # parents first, without recursion
+            pending = [self]
+            parent = self.parent
+            while parent and parent.computedStyle is None:
+                pending.append(parent)
+                parent = parent.parent
+            for item in reversed(pending):
+                computed = item.computeStyle()
+        return computed
+
+    def computeStyle(self, parentStyle: css.ComputedStyle = None):
+        """
+        Runs the cascade for this component and stores it at computedStyle.
+
+        If no parentStyle is given, the parent one is used.
+        """
+        style = self.props.get("style")
         if isinstance(style, Component):
-            return style.getStyle(csskey, default)
-        if csskey in style:
-            return style[csskey]
-        value = self.document.stylesheet.getStyle(self, csskey)
-        if value:
-            return value
-        if csskey in css.INHERITABLE_STYLES and self.parent:
-            return self.parent.getStyle(csskey, default)
+            return style.getComputedStyle()
+        parent = self.parent
+        if parentStyle is None and parent:
+            parentStyle = parent.getComputedStyle()
+        # parents may have changed too
+        self.ancestorFilter = None
+        document = self.document
+
+        # siblings with the same name, classes, state and inline style, share the style
+        if parent:
+            cache = parent.childStyleCache
+            if (
+                cache is None
+                or cache[0] is not parentStyle
+                or cache[1] != document.stylePass
+            ):
+                cache = (parentStyle, document.stylePass, {})
+                parent.childStyleCache = cache
+            props = self.props
+            key = (
+                self.name,
+                props.get("id"),
+                props.get("className"),
+                id(style),
+                self in document.focusPath,
+                self is document.currentOpenElement,
+                document.stylesheet.version,
+            )
+            shared = cache[2].get(key)
+            if shared and shared[0] is style:
+                computed = shared[1]
+                self.setComputedStyle(computed)
+                return computed
+
+        own = document.stylesheet.computeStyle(self)
+        if style:
+            own.update(style)
+        computed = css.ComputedStyle(own, parentStyle)
+        self.setComputedStyle(computed)
+        if parent:
+            cache[2][key] = (style, computed)
+        return computed
+
+    def setComputedStyle(self, computed: css.ComputedStyle):
+        previous = self.previousStyle or self.computedStyle
+        self.previousStyle = None
+        self.computedStyle = computed
+        if previous is not None and previous.layoutKey != computed.layoutKey:
+            # also how the parent places us, even if we are a relayout boundary
+            self.layoutDirty = True
+            (self.parent or self).setLayoutDirty()
+
+    def inheritStyle(self, parentStyle: css.ComputedStyle):
+        """
+        The parent style changed, so get again the inherited values.
+
+        Returns if what our children inherit changed.
+        """
+        prev = self.computedStyle
+        if prev is None:
+            self.computeStyle(parentStyle)
+            return True
+        if isinstance(self.props.get("style"), Component):
+            return True
+        computed = css.ComputedStyle(prev.own, parentStyle)
+        self.computedStyle = computed
+        return computed.inherited != prev.inherited
+
+    def getAncestorFilter(self) -> int:
+        """
+        Bloom filter with the names, ids and classes of all the parents.
+
+        Allows to discard descendant selectors (div span) without walking
+        the parents. It is calculated top-down as styles are resolved.
+        """
+        ancestorFilter = self.ancestorFilter
+        if ancestorFilter is not None:
+            return ancestorFilter
+
+        pending = [self]
+        parent = self.parent
+        while parent and parent.ancestorFilter is None:
+            pending.append(parent)
+            parent = parent.parent
+        for item in reversed(pending):
+            parent = item.parent
+            if parent:
+                props = parent.props
+                ancestorFilter = parent.ancestorFilter | css.elementBloom(
+                    parent.name, props.get("id"), props.get("className")
+                )
+            else:
+                ancestorFilter = 0
+            item.ancestorFilter = ancestorFilter
+        return ancestorFilter
+
+    def invalidateStyle(self, subtree=False):
+        """
+        Must be called when something the style depends on changes: props
+        (className, id, style) or state (:focus, :open).
+
+        If subtree, all the descendants are resolved again too, as
+        needed when the change affects rules as "a b".
+
+        Document.calculateStyles resolves it again and pushes down the
+        inherited changes.
+        """
+        if self.computedStyle is not None:
+            self.previousStyle = self.computedStyle
+            self.computedStyle = None
+        if subtree:
+            self.styleDirtySubtree = True
+        document = self.document
+        if not document:
+            return
+        document.stylesPending = True
+        parent = self.parent
+        while parent and not parent.styleDirtyDescendants:
+            parent.styleDirtyDescendants = True
+            parent = parent.parent
+
+    def getStyle(self, csskey: css.StyleProperty, default=None):
+        values = self.getComputedStyle().values
+        if csskey in values:
+            return values[csskey]
         return default
 
-    def calculateProportion(self, current, rule):
+    def calculateProportion(self, current, rule: css.Length):
         """
         Many sizes and positions are relative to the parent size
 
-        This function hides this
+        This function hides this. Rule is a parsed length, as at
+        ComputedStyle, but raw values are also accepted.
         """
-        # WIP, only fixed char sizes
         if rule is None:
             return None
-        if isinstance(rule, int):
-            return max(0, min(current, rule))
-        if isinstance(rule, str):
-            if rule == "auto":
+        if not isinstance(rule, tuple):
+            rule = css.parseLength(rule)
+            if rule is None:
                 return None
-            if rule.endswith("%"):
-                return int(current * int(rule[:-1]) / 100)
-            logger.warning("Invalid width rule: %s", rule)
+        kind, value = rule
+        if kind == "percent":
+            if current > INDEFINITE:
+                return None
+            return int(current * value / 100)
+        return max(0, min(current, value))
+
+    def measure(self, min_width, min_height, max_width, max_height):
+        """
+        Calculates the layout sizes, or reuses the last ones if nothing
+        changed since and the constraints are the same.
+        """
+        constraints = (min_width, min_height, max_width, max_height)
+        size = self.getMeasured(constraints)
+        if size is None:
+            size = self.calculateLayoutSizes(*constraints)
+        return size
+
+    def measureKey(self, min_width, min_height, max_width, max_height):
+        """
+        What of the constraints the layout depends on.
+
+        A fixed width or height does not depend on the given min and max,
+        while the available space is enough, so when the terminal is
+        resized, fixed size components keep their layout. The same with
+        percentages if the parent size does not change.
+        """
+        style = self.getComputedStyle()
+        min_width = style.minWidth or min_width
+        min_height = style.minHeight or min_height
+        max_width = style.maxWidth or max_width
+        max_height = style.maxHeight or max_height
+
+        width = self.calculateProportion(max_width, style.width)
+        height = self.calculateProportion(max_height, style.height)
+        return (
+            (width,) if width else (min_width, max_width),
+            (height,) if height else (min_height, max_height),
+        )
+
+    @property
+    def layoutConstraints(self):
+        """
+        The constraints the current layout (and the children one) was
+        calculated with. Kept at the layout, so at the LayoutStore if any.
+        """
+        return self.layout.constraints
+
+    @layoutConstraints.setter
+    def layoutConstraints(self, constraints):
+        self.layout.constraints = constraints
+
+    def getMeasured(self, constraints):
+        """
+        The size for the constraints if the layout is still valid, else None.
+        """
+        if self.layoutDirty or self.measuredKey is None:
+            return None
+        if (
+            self.layoutConstraints == constraints
+            or self.measureKey(*constraints) == self.measuredKey
+        ):
+            self.layoutConstraints = constraints
+            width, height = size = self.measuredSize
+            self.layout.width = width
+            self.layout.height = height
+            return size
         return None
 
-    def calculateLayoutSizes(
-        self, min_width, min_height, max_width, max_height, clip=True
-    ):
+    def setMeasured(self, constraints, size):
+        self.layoutDirty = False
+        self.layoutConstraints = constraints
+        self.measuredKey = self.measureKey(*constraints)
+        self.measuredSize = size
+        self.overflows = any(
+            child.overflows or child.getComputedStyle().position == "absolute"
+            for child in self.children
+        )
+
+    def calculateLayoutSizes(self, min_width, min_height, max_width, max_height):
         """
         Calculates the layout inside the desired rectangle.
 
-        Given the given constraints, sets own size.
+        Given the given constraints, sets own size, and the children ones.
         Once we have the size, position is calculated later.
+
+        Runs the layoutSizes steps of this component and of the
+        descendants that need it, with an explicit stack instead of
+        recursion, so very deep trees do not reach the recursion limit.
+        """
+        # (component, constraints, steps) waiting for a child size
+        stack = []
+        constraints = (min_width, min_height, max_width, max_height)
+        size = self.startLayoutSizes(constraints, stack)
+        while stack:
+            item, constraints, steps = stack[-1]
+            try:
+                child, childConstraints = steps.send(size)
+            except StopIteration as done:
+                stack.pop()
+                size = done.value
+                item.setMeasured(constraints, size)
+                continue
+            size = child.getMeasured(childConstraints)
+            if size is None:
+                size = child.startLayoutSizes(childConstraints, stack)
+        return size
+
+    def startLayoutSizes(self, constraints, stack):
+        if self.isHidden():
+            self.layout.width = 0
+            self.layout.height = 0
+            self.setMeasured(constraints, (0, 0))
+            return (0, 0)
+        steps = self.layoutSizes(*constraints)
+        if isinstance(steps, tuple):  # calculated at once
+            self.setMeasured(constraints, steps)
+            return steps
+        stack.append((self, constraints, steps))
+        return None
+
+    def layoutSizes(self, min_width, min_height, max_width, max_height, clip=True):
+        """
+        Steps to calculate the layout sizes, see calculateLayoutSizes.
+
+        Yields (child, constraints) for each child to measure, and gets
+        back the child size, once the child layout is done. Returns the
+        own size.
+
+        Components without children to measure may just return the size.
         """
-        min_width = self.getStyle("minWidth") or min_width
-        min_height = self.getStyle("minHeight") or min_height
-        max_width = self.getStyle("maxWidth") or max_width
-        max_height = self.getStyle("maxHeight") or max_height
+        style = self.getComputedStyle()
+        min_width = style.minWidth or min_width
+        min_height = style.minHeight or min_height
+        max_width = style.maxWidth or max_width
+        max_height = style.maxHeight or max_height
 
-        width = self.calculateProportion(max_width, self.getStyle("width"))
+        width = self.calculateProportion(max_width, style.width)
         if width:  # if there is a desired width, it is used
             min_width = width
             max_width = width
-        height = self.calculateProportion(max_height, self.getStyle("height"))
+        height = self.calculateProportion(max_height, style.height)
         if height:  # if there is a desired height, it is used
             min_height = height
             max_height = height
 
-        border = self.getStyle("border", 0)
-        if border:
-            border = 2
+        border = style.border * 2
+        padding_width = style.paddingLeft + style.paddingRight + border
+        padding_height = style.paddingTop + style.paddingBottom + border
 
-        max_width_pb = max_width - (
-            self.getStyle("paddingLeft", 0) + self.getStyle("paddingRight", 0) + border
-        )
-        max_height_pb = max_height - (
-            self.getStyle("paddingTop", 0) + self.getStyle("paddingBottom", 0) + border
-        )
+        max_width_pb = max_width - padding_width
+        max_height_pb = max_height - padding_height
 
-        direction = self.getStyle("flex-direction")
-        if direction == "row":
-            width, height = self.calculateLayoutSizesRow(
+        if style.display == "grid":
+            width, height = yield from self.layoutSizesGrid(
+                0, 0, max_width_pb, max_height_pb
+            )
+        elif style.flexDirection == "row":
+            width, height = yield from self.layoutSizesRow(
                 0, 0, max_width_pb, max_height_pb
             )
         else:  # default for even unknown is vertical stack
-            width, height = self.calculateLayoutSizesColumn(
+            width, height = yield from self.layoutSizesColumn(
                 0, 0, max_width_pb, max_height_pb
             )
 
-        width += (
-            self.getStyle("paddingLeft", 0)
-            + self.getStyle("paddingRight", 0)
-            + (self.getStyle("border", 0) and 2)
-        )
-        height += (
-            self.getStyle("paddingTop", 0)
-            + self.getStyle("paddingBottom", 0)
-            + (self.getStyle("border", 0) and 2)
-        )
+        width += padding_width
+        height += padding_height
 
         if clip:
             width = min(max_width, max(width, min_width))
@@ -377,21 +956,23 @@ class Component:
         return (width, height)
 
     def split_fixed_variable_children(self):
-        children_grow = [(x, x.getStyle("flex-grow")) for x in self.children]
+        children_grow = [(x, x.getComputedStyle().flexGrow) for x in self.children]
         fixed = [x for x in children_grow if not x[1]]
         variable = [x for x in children_grow if x[1]]
         return fixed, variable
 
-    def calculateLayoutSizesColumn(self, min_width, min_height, max_width, max_height):
+    def layoutSizesColumn(self, min_width, min_height, max_width, max_height):
         fixed_children, variable_children = self.split_fixed_variable_children()
+        if max_height > INDEFINITE:
+            fixed_children += variable_children
+            variable_children = []
 
         width = min_width
         height = 0
         for child, _grow in fixed_children:
-            child.calculateLayoutSizes(0, 0, max_width, max_height)
+            yield child, (0, 0, max_width, max_height)
 
-            childposition = child.getStyle("position")
-            if childposition != "absolute":
+            if child.getComputedStyle().position != "absolute":
                 height += child.layout.height
                 width = max(width, child.layout.width)
                 max_height = max_height - child.layout.height
@@ -402,14 +983,13 @@ class Component:
             quant_size = max_height / quants
             for child, grow in variable_children:
                 cheight = math.floor(quant_size * grow)
-                child.calculateLayoutSizes(
+                yield child, (
                     min_width,
                     cheight,  # fixed height
                     max_width,
                     cheight,
                 )
-                childposition = child.getStyle("position")
-                if childposition != "absolute":
+                if child.getComputedStyle().position != "absolute":
                     height += child.layout.height
                     width = max(width, child.layout.width)
                     max_height = max_height - child.layout.height
@@ -417,19 +997,21 @@ class Component:
 
         # this is equivalent to align items stretch
         for child in self.children:
-            childposition = child.getStyle("position")
-            if childposition != "absolute":
+            if child.getComputedStyle().position != "absolute" and not child.isHidden():
                 child.layout.width = width
         return (width, height)
 
-    def calculateLayoutSizesRow(self, min_width, min_height, max_width, max_height):
+    def layoutSizesRow(self, min_width, min_height, max_width, max_height):
         fixed_children, variable_children = self.split_fixed_variable_children()
+        if max_width > INDEFINITE:
+            fixed_children += variable_children
+            variable_children = []
 
         width = 0
         height = min_height
 
         for child, _grow in fixed_children:
-            child.calculateLayoutSizes(0, 0, max_width, max_height)
+            yield child, (0, 0, max_width, max_height)
             width += child.layout.width
             height = max(height, child.layout.height)
             max_width = max_width - child.layout.width
@@ -440,7 +1022,7 @@ class Component:
             quant_size = max_width / quants
             for child, grow in variable_children:
                 cwidth = math.floor(quant_size * grow)
-                child.calculateLayoutSizes(
+                yield child, (
                     cwidth,
                     min_width,  # fixed width
                     cwidth,
@@ -453,36 +1035,150 @@ class Component:
 
         # this is equivalent to align items stretch
         for child in self.children:
-            child.layout.height = height
+            if not child.isHidden():
+                child.layout.height = height
         return (width, height)
 
+    def layoutSizesGrid(self, min_width, min_height, max_width, max_height):
+        """
+        Places the children in order at the cells, row by row, so all the
+        grid is done in one pass over the children.
+
+        Columns are as grid-template-columns says, auto ones as 1fr.
+        Rows are as grid-template-rows says, and the ones not there take
+        the height of their content.
+        """
+        style = self.getComputedStyle()
+        children = []
+        for child in self.children:
+            if child.getComputedStyle().position == "absolute" or child.isHidden():
+                yield child, (0, 0, max_width, max_height)
+            else:
+                children.append(child)
+
+        column_tracks = tuple(
+            ("fr", 1) if kind == "auto" else (kind, value)
+            for kind, value in style.gridColumns or (("fr", 1),)
+        )
+        columns = trackSizes(column_tracks, max_width)
+        ncolumns = len(columns)
+        row_tracks = style.gridRows or ()
+        nrows = -(-len(children) // ncolumns)
+        if nrows > len(row_tracks):
+            row_tracks += (("auto", 0),) * (nrows - len(row_tracks))
+        rows = list(trackSizes(row_tracks, max_height))
+
+        # auto rows first, the fr ones share what they leave
+        used = 0
+        free = max_height - sum(
+            size for (kind, _value), size in zip(row_tracks, rows) if kind != "fr"
+        )
+        for row, (kind, _value) in enumerate(row_tracks):
+            if kind != "auto":
+                continue
+            cells = children[row * ncolumns : (row + 1) * ncolumns]
+            height = 0
+            for child, width in zip(cells, columns):
+                yield child, (width, 0, width, max(0, free - used))
+                height = max(height, child.layout.height)
+            # this is equivalent to align items stretch
+            for child in cells:
+                child.layout.height = height
+            rows[row] = height
+            used += height
+        if used:
+            sizes = trackSizes(row_tracks, max_height, used)
+            rows = [
+                size if kind == "fr" else current
+                for (kind, _value), size, current in zip(row_tracks, sizes, rows)
+            ]
+
+        for index, child in enumerate(children):
+            row, column = divmod(index, ncolumns)
+            if row_tracks[row][0] == "auto":
+                continue
+            width = columns[column]
+            height = rows[row]
+            yield child, (width, height, width, height)
+
+        self.gridTracks = (columns, rows)
+        return (sum(columns), sum(rows))
+
+    def gridChildrenPosition(self, x, y):
+        """
+        Places the children at the cells of the last layoutSizesGrid.
+        """
+        columns, rows = self.gridTracks
+        lefts = list(itertools.accumulate(columns, initial=x))
+        tops = list(itertools.accumulate(rows, initial=y))
+        ncolumns = len(columns)
+        index = 0
+        for child in self.children:
+            if child.isHidden():
+                continue
+            child_style = child.getComputedStyle()
+            if child_style.position == "absolute":
+                left = child_style.left
+                child.layout.x = (
+                    self.calculateProportion(self.layout.width, left)
+                    if left is not None
+                    else x
+                )
+                top = child_style.top
+                child.layout.y = (
+                    self.calculateProportion(self.layout.height, top)
+                    if top is not None
+                    else y
+                )
+                continue
+            row, column = divmod(index, ncolumns)
+            child.layout.x = lefts[column]
+            child.layout.y = tops[row]
+            index += 1
+
     def calculateLayoutPosition(self):
+        """
+        Calculates the position of all the descendants, parents first and
+        without recursion.
+        """
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if item.isHidden():
+                continue
+            item.calculateChildrenPosition()
+            stack.extend(item.children)
+
+    def calculateChildrenPosition(self):
         """
         Calculates the position of children: same as parent + sizeof prev childs.
         """
 
-        x = (
-            self.layout.x
-            + self.getStyle("paddingLeft", 0)
-            + (self.getStyle("border", 0) and 1)
-        )
+        style = self.getComputedStyle()
+        x = self.layout.x + style.paddingLeft + style.border
+        y = self.layout.y + style.paddingTop + style.border
 
-        y = (
-            self.layout.y
-            + self.getStyle("paddingTop", 0)
-            + (self.getStyle("border", 0) and 1)
-        )
+        # Text shares the parent style, but has no tracks of its own
+        if style.display == "grid" and self.gridTracks is not None:
+            self.gridChildrenPosition(x, y)
+            return
 
         # print(self, x, y)
         child: Component
-        def_align = self.getStyle("align-items")
-        dir_row = self.getStyle("flex-direction") == "row"
+        def_align = style.alignItems
+        dir_row = style.flexDirection == "row"
+        if self.flowChildrenPosition(x, y, def_align, dir_row):
+            return
         for child in self.children:
-            align = child.getStyle("align-self", def_align)
-            justify = child.getStyle("justify-self", def_align)
-            childposition = child.getStyle("position")
-
-            if childposition == "absolute":
+            child_style = child.getComputedStyle()
+            align = child_style.alignSelf
+            if align is None:
+                align = def_align
+            justify = child_style.justifySelf
+            if justify is None:
+                justify = def_align
+
+            if child_style.position == "absolute":
                 px = 0  # should get it from parent with relative
                 py = 0
                 from_top = False
@@ -518,20 +1214,19 @@ class Component:
                     else:
                         from_top = True
                 if from_left:
-                    left = child.getStyle("left")
+                    left = child_style.left
                     child.layout.x = (
                         self.calculateProportion(self.layout.width, left)
                         if left is not None
                         else x
                     )
                 if from_top:
-                    top = child.getStyle("top")
+                    top = child_style.top
                     child.layout.y = (
                         self.calculateProportion(self.layout.height, top)
                         if top is not None
                         else y
                     )
-                child.calculateLayoutPosition()
             else:
                 child.layout.y = y
                 child.layout.x = x
@@ -560,12 +1255,43 @@ class Component:
                             self.layout.x
                             + (self.layout.width - child.layout.width) // 2
                         )
-                child.calculateLayoutPosition()
                 if dir_row:
                     x += child.layout.width
                 else:
                     y += child.layout.height
 
+    def flowChildrenPosition(self, x, y, def_align, dir_row):
+        """
+        If all the children just go one after the other, and their
+        layouts are at a LayoutStore, places all of them at once.
+
+        Returns if it did.
+        """
+        store = self.layoutStore
+        children = self.children
+        if (
+            store is None
+            or not store.vectorize
+            or len(children) < layoutstore.VECTORIZE_MIN_CHILDREN
+        ):
+            return False
+        indexes = []
+        for child in children:
+            layout = child.layout
+            if getattr(layout, "store", None) is not store:
+                return False
+            child_style = child.getComputedStyle()
+            if child_style.position == "absolute":
+                return False
+            align = child_style.alignSelf
+            if align is None:
+                align = def_align
+            if align == "end" or align == "center":
+                return False
+            indexes.append(layout.index)
+        store.flowPositions(indexes, x, y, dir_row)
+        return True
+
     def prettyPrint(self, indent=0):
         def printable(v):
             if callable(v):
@@ -589,11 +1315,8 @@ class Component:
             or ""
         )
         pseudo = []
-        if self.document.currentFocusedElement:
-            for el in self.document.currentFocusedElement.parentTraversal():
-                if self == el:
-                    pseudo.append(":focus")
-                    break
+        if self in self.document.focusPath:
+            pseudo.append(":focus")
         if self == self.document.currentOpenElement:
             pseudo.append(":open")
         pseudo = " ".join(pseudo)
@@ -607,12 +1330,18 @@ class Component:
 
 
 def renderer_clipping(func):
+    """
+    Decorator for paintSteps to clip to the component layout.
+    """
+
     def wrapper(self: Component, renderer: Renderer):
         layout = self.layout
 
         renderer.pushClipping(layout.as_clipping())
         try:
-            func(self, renderer)
+            steps = func(self, renderer)
+            if steps is not None:
+                yield from steps
         finally:
             renderer.popClipping()
 
@@ -625,19 +1354,18 @@ class Paintable(HandleEventTrait, Component):
     This component can be painted with the given renderer
     """
 
-    def paint(self, renderer: Renderer):
-        color = self.getStyle("color")
+    def paintSteps(self, renderer: Renderer):
+        style = self.getComputedStyle()
+        color = style.color
         if color:
             renderer.setForeground(color)
-        background = self.getStyle("background")
+        background = style.background
         if background:
             renderer.setBackground(background)
-            border = self.getStyle("border")
+            border = style.border
 
             if border:
-                renderer.setForeground(
-                    self.getStyle("borderColor") or self.getStyle("color")
-                )
+                renderer.setForeground(style.borderColor or color)
                 renderer.setLineWidth(self.getStyle("border", 0))
                 renderer.fillStroke(
                     self.layout.x,
@@ -653,7 +1381,7 @@ class Paintable(HandleEventTrait, Component):
                     self.layout.height,
                 )
 
-        super().paint(renderer)
+        yield from super().paintSteps(renderer)
 
 
 class Text(Paintable):
@@ -663,29 +1391,37 @@ class Text(Paintable):
     def getStyle(self, csskey: css.StyleProperty, default=None):
         return self.parent.getStyle(csskey, default)
 
-    def paint(self, renderer: Renderer):
+    def getComputedStyle(self) -> css.ComputedStyle:
+        return self.parent.getComputedStyle()
+
+    def computeStyle(self, parentStyle: css.ComputedStyle = None):
+        return parentStyle or self.parent.getComputedStyle()
+
+    def inheritStyle(self, parentStyle: css.ComputedStyle):
+        return False
+
+    def paintSteps(self, renderer: Renderer):
         text = self.props.get("text")
         if text:
-            color = self.getStyle("color")
-            if color:
-                renderer.setForeground(color)
-            background = self.getStyle("background")
-            if background:
-                renderer.setBackground(background)
-            fontWeight = self.getStyle("font-weight")
-            fontDecoration = self.getStyle("font-decoration")
-            fontStyle = self.getStyle("font-style")
+            style = self.getComputedStyle()
+            if style.color:
+                renderer.setForeground(style.color)
+            if style.background:
+                renderer.setBackground(style.background)
 
             renderer.fillText(
                 str(text),
                 self.layout.x,
                 self.layout.y,
-                bold=fontWeight == "bold",
-                underline=fontDecoration == "underline",
-                italic=fontStyle == "italic",
+                bold=style.fontWeight == "bold",
+                underline=style.fontDecoration == "underline",
+                italic=style.fontStyle == "italic",
             )
 
-    def calculateLayoutSizes(self, min_width, min_height, max_width, max_height):
+    def measureKey(self, min_width, min_height, max_width, max_height):
+        return (min_width, min_height, max_width, max_height)
+
+    def layoutSizes(self, min_width, min_height, max_width, max_height):
         text = self.props.get("text", "").split("\n")
         height = min(1, len(text))
         width = max(len(x) for x in text)
@@ -709,43 +1445,167 @@ class Scrollable(Paintable):
     This widget can have scrollbars
     """
 
-    state = {
-        "x": 0,
-        "y": 0,
-    }
-    innerLayout = Layout()
+    # size of the content
+    innerLayout: Layout = None
+    # scroll offset, only used at paint. See scrollTo
+    scrollX: int = 0
+    scrollY: int = 0
+    # for column content, the constraints the rows are measured with, the
+    # height of the ones not measured yet, and where each one starts.
+    # See measureRows
+    rowConstraints: tuple = None
+    estimatedRowHeight: int = 1
+    rowTops: list = None
 
     def __init__(self, **kwargs):
         super().__init__(on_keypress=self.handleKeyPress, **kwargs)
+        self.innerLayout = Layout()
 
     def handleKeyPress(self, ev: EventKeyPress):
         match ev.keycode:
             case "DOWN":
                 maxy = self.innerLayout.height - self.layout.height
-                self.setState({"y": min(self.state["y"] + 1, maxy)})
+                self.scrollTo(self.scrollX, min(self.scrollY + 1, maxy))
                 ev.stopPropagation = True
             case "UP":
-                self.setState({"y": max(self.state["y"] - 1, 0)})
+                self.scrollTo(self.scrollX, max(self.scrollY - 1, 0))
                 ev.stopPropagation = True
 
             case "LEFT":
-                self.setState({"x": self.state["x"] + 1})
+                self.scrollTo(self.scrollX + 1, self.scrollY)
                 ev.stopPropagation = True
             case "RIGHT":
-                self.setState({"x": self.state["x"] - 1})
+                self.scrollTo(self.scrollX - 1, self.scrollY)
                 ev.stopPropagation = True
 
-    def calculateLayoutSizes(self, min_width, min_height, max_width, max_height):
-        w, h = super().calculateLayoutSizes(0, 0, 128, 128, clip=False)
-        self.innerLayout.width = w
-        self.innerLayout.height = h
-        self.layout.width = max_width
-        self.layout.height = max_height
+    def scrollTo(self, x: int, y: int):
+        """
+        Shows the content from (x, y).
+
+        It is not state: the content does not render nor layout again,
+        only the next paint is translated.
+        """
+        self.scrollX = x
+        self.scrollY = y
+
+    def isRelayoutBoundary(self):
+        # takes all the given space, if bounded
+        constraints = self.layoutConstraints
+        return (
+            constraints is not None
+            and constraints[2] <= INDEFINITE
+            and constraints[3] <= INDEFINITE
+        )
+
+    def measureKey(self, min_width, min_height, max_width, max_height):
+        # takes all the space, whatever the content
+        return (max_width, max_height)
+
+    def layoutSizes(self, min_width, min_height, max_width, max_height):
+        style = self.getComputedStyle()
+        if style.flexDirection == "row" or style.display == "grid":
+            # the content does not depend on our constraints, so if only
+            # they changed, it is as it was
+            if self.layoutDirty:
+                w, h = yield from super().layoutSizes(
+                    0, 0, UNBOUNDED, UNBOUNDED, clip=False
+                )
+                self.innerLayout.width = w
+                self.innerLayout.height = h
+        else:
+            border = style.border * 2
+            width = max_width - style.paddingLeft - style.paddingRight - border
+            constraints = (0, 0, width, UNBOUNDED)
+            if self.layoutDirty or constraints != self.rowConstraints:
+                self.layout.width = max_width
+                self.layout.height = max_height
+                self.layoutRows(constraints)
+        # all the given space, or if unbounded, as a nested Scrollable,
+        # the content one
+        inner = self.innerLayout
+        self.layout.width = max_width if max_width <= INDEFINITE else inner.width
+        self.layout.height = max_height if max_height <= INDEFINITE else inner.height
         return (self.layout.width, self.layout.height)
 
-    def paint(self, renderer: Renderer):
+    def layoutRows(self, constraints):
+        """
+        Lays out column content progressively: the rows around the
+        viewport are measured, and the rest take the average height of
+        those until scrolled near, so long content needs neither a full
+        measure nor a limit.
+        """
+        self.rowConstraints = constraints
+        self.rowTops = [0] * (len(self.children) + 1)
+        self.estimateRows()
+        heights, _moved = self.measureRows()
+        if heights:
+            estimated = max(1, round(sum(heights) / len(heights)))
+            if estimated != self.estimatedRowHeight:
+                self.estimatedRowHeight = estimated
+                self.estimateRows()
+
+    def estimateRows(self):
+        constraints = self.rowConstraints
+        width = constraints[2]
+        estimated = self.estimatedRowHeight
+        for child in self.children:
+            if child.getMeasured(constraints) is None:
+                child.layout.height = estimated
+            child.layout.width = width
+        self.updateRowTops(0)
+
+    def measureRows(self):
+        """
+        Measures the rows around the viewport not measured yet, and moves
+        the next ones if the estimate was wrong.
+
+        Returns the heights of the measured rows, and if they moved.
+        """
+        tops = self.rowTops
+        children = self.children
+        if len(tops) != len(children) + 1:  # not laid out yet
+            return [], False
+        constraints = self.rowConstraints
+        width = constraints[2]
+        margin = self.layout.height * SCROLL_MEASURE_MARGIN
+        bottom = self.scrollY + self.layout.height + margin
+        start = max(0, bisect.bisect_right(tops, self.scrollY - margin) - 1)
+
+        heights = []
+        moved = False
+        y = tops[start]
+        index = start
+        while index < len(children) and y < bottom:
+            child = children[index]
+            if child.getMeasured(constraints) is None:
+                estimated = child.layout.height
+                _width, height = child.measure(*constraints)
+                heights.append(height)
+                moved = moved or height != estimated
+            child.layout.width = width
+            y += child.layout.height
+            index += 1
+        if moved:
+            self.updateRowTops(start)
+        return heights, moved
+
+    def updateRowTops(self, start):
+        tops = self.rowTops
+        for index, child in enumerate(self.children[start:], start):
+            tops[index + 1] = tops[index] + child.layout.height
+        style = self.getComputedStyle()
+        border = style.border * 2
+        self.innerLayout.width = (
+            self.rowConstraints[2] + style.paddingLeft + style.paddingRight + border
+        )
+        self.innerLayout.height = (
+            tops[-1] + style.paddingTop + style.paddingBottom + border
+        )
+
+    def paintSteps(self, renderer: Renderer):
         # first fill background
-        background = self.getStyle("background")
+        style = self.getComputedStyle()
+        background = style.background
         renderer.setBackground(background)
         renderer.fillRect(
             self.layout.x,
@@ -754,17 +1614,24 @@ class Scrollable(Paintable):
             self.layout.height,
         )
 
-        renderer.pushTranslate((-self.state["x"], -self.state["y"]))
+        renderer.pushTranslate((-self.scrollX, -self.scrollY))
         renderer.pushClipping(self.layout.as_clipping())
         try:
-            super().paint(renderer)
+            if self.rowTops is not None:
+                # rows may be measured just now, or moved
+                _heights, moved = self.measureRows()
+                if moved:
+                    self.calculateChildrenPosition()
+                # with the clipping, to know which are visible
+                for child in self.visibleChildren(renderer):
+                    child.calculateLayoutPosition()
+            yield from super().paintSteps(renderer)
         finally:
             renderer.popClipping()
             renderer.popTranslate()
 
         renderer.setBackground(background)
-        foreground = self.getStyle("color")
-        renderer.setForeground(foreground)
+        renderer.setForeground(style.color)
 
         # scrollbar = "▲┃█▼◀━█▶"
         scrollbar = "▕▕█▕▁▁▄▁"
@@ -779,8 +1646,8 @@ class Scrollable(Paintable):
             oh = self.layout.height
             ih = self.innerLayout.height
 
-            ty = self.state["y"]
-            by = self.state["y"] + 1
+            ty = self.scrollY
+            by = self.scrollY + 1
             if miny + 2 < maxy:
                 renderer.fillText(scrollbar[0], x, miny)
                 for y in range(miny + 1, maxy):
@@ -796,8 +1663,8 @@ class Scrollable(Paintable):
             minx = self.layout.x
             maxx = self.layout.x + self.layout.width - 1
 
-            tx = -self.state["x"]
-            bx = -self.state["x"] + 1
+            tx = -self.scrollX
+            bx = -self.scrollX + 1
             if minx + 2 < maxx:
                 renderer.fillText(scrollbar[4], minx, y)
                 for x in range(minx + 1, maxx):
@@ -1,7 +1,14 @@
 from dataclasses import dataclass
-import re
+import hashlib
 import logging
+import os
+import pathlib
+import pickle
+import re
 from typing import Literal
+import zlib
+
+from retui import defaults
 
 
 StyleProperty = Literal[
@@ -13,6 +20,9 @@ StyleProperty = Literal[
     "border",
     "width",
     "height",
+    "display",
+    "grid-template-columns",
+    "grid-template-rows",
 ]
 
 # this styles are checked against parents if not defined
@@ -32,6 +42,47 @@ CSS_SELECTOR_RE = re.compile(
 logger = logging.getLogger(__name__)
 
 
+# splits compound selectors: "dialog > div span" -> dialog, >, div, None, span
+CSS_COMBINATOR_RE = re.compile(r"\s*(>)\s*|\s+")
+
+BLOOM_CACHE: dict = {}
+
+
+def bloomBits(feature: str) -> int:
+    """
+    Two bits, out of 128, for this feature (element name, #id or .class)
+
+    Uses a stable hash, as compiled selectors are cached on disk.
+    """
+    try:
+        return BLOOM_CACHE[feature]
+    except KeyError:
+        pass
+    h = zlib.crc32(feature.encode())
+    bits = (1 << (h & 127)) | (1 << ((h >> 7) & 127))
+    BLOOM_CACHE[feature] = bits
+    return bits
+
+
+def elementBloom(name: str, id: str | None, className: str | None) -> int:
+    """
+    Bloom filter of an element features, as used for ancestor filters.
+    """
+    key = (name, id, className)
+    try:
+        return BLOOM_CACHE[key]
+    except KeyError:
+        pass
+    bits = bloomBits(name)
+    if id:
+        bits |= bloomBits(f"#{id}")
+    if className:
+        for cls in className.split():
+            bits |= bloomBits(f".{cls}")
+    BLOOM_CACHE[key] = bits
+    return bits
+
+
 @dataclass
 class Selector:
     selector: str
@@ -41,6 +92,11 @@ class Selector:
     classes: list[str] = None
     pseudo: list[str] = None
     priority: int = 0
+    # for "header > div span", [(False, <div>), (True, <header>)]: if is
+    # a child (>) combinator, and the compound selector. Closest first.
+    ancestors: list[tuple[bool, "Selector"]] = None
+    # all the features the ancestors must have, for a fast reject
+    ancestorBits: int = 0
 
     def __init__(self, selector: str):
         """
@@ -51,6 +107,28 @@ class Selector:
         self.selector = selector
         self.pseudo = []
         self.classes = []
+        self.ancestors = []
+
+        parts = CSS_COMBINATOR_RE.split(selector.strip())
+        compounds = parts[0::2]
+        combinators = parts[1::2]
+        if len(compounds) > 1:
+            for combinator, compound in zip(
+                reversed(combinators), reversed(compounds[:-1])
+            ):
+                ancestor = Selector(compound)
+                if not compound or ancestor.priority < 0:
+                    logger.warning("Invalid selector: %s", selector)
+                    self.priority = -1
+                    return
+                self.ancestors.append((combinator == ">", ancestor))
+                self.ancestorBits |= ancestor.bloom()
+                self.priority += ancestor.priority
+            selector = compounds[-1]
+            if not selector:
+                logger.warning("Invalid selector: %s", self.selector)
+                self.priority = -1
+                return
 
         match = CSS_SELECTOR_RE.match(selector)
         if not match:
@@ -79,7 +157,33 @@ class Selector:
         if self.pseudo is None:
             self.pseudo = []
 
+    def bloom(self) -> int:
+        """
+        Bits any element matching this compound selector has at its bloom.
+        """
+        bits = 0
+        if self.element:
+            bits |= bloomBits(self.element)
+        if self.id:
+            bits |= bloomBits(f"#{self.id}")
+        for cls in self.classes:
+            bits |= bloomBits(f".{cls}")
+        return bits
+
     def match(self, element: "tui.Component"):
+        if not self.matchCompound(element):
+            return False
+
+        if self.ancestors:
+            bits = self.ancestorBits
+            if element.getAncestorFilter() & bits != bits:
+                return False
+            if not self.matchAncestors(element, 0):
+                return False
+
+        return self.priority
+
+    def matchCompound(self, element: "tui.Component"):
         if self.element and element.name != self.element:
             return False
 
@@ -96,36 +200,560 @@ class Selector:
                     return False
 
         if "focus" in self.pseudo:
-            focused = element.document.currentFocusedElement
-            while focused:
-                if focused == element:
-                    return self.priority
-                focused = focused.parent
+            # the focused element and all its parents
+            document = element.document
+            if not document or element not in document.focusPath:
+                return False
 
-            return False
+        return True
 
-        return self.priority
+    def matchAncestors(self, element: "tui.Component", index: int):
+        """
+        Checks the ancestors from index on, right to left.
+        """
+        if index == len(self.ancestors):
+            return True
+        is_child, compound = self.ancestors[index]
+        parent = element.parent
+        while parent:
+            if compound.matchCompound(parent) and self.matchAncestors(
+                parent, index + 1
+            ):
+                return True
+            if is_child:
+                return False
+            parent = parent.parent
+        return False
 
     def __repr__(self):
         return f"<Selector '{self.selector}'>"
 
 
-class StyleSheet:
-    rules: list[tuple[Selector, dict]] = []
+# lengths are parsed once into (kind, value), kind is "cells" or "percent".
+# None is auto.
+Length = tuple[Literal["cells", "percent"], int] | None
 
-    def __init__(self):
+LENGTH_CACHE: dict = {}
+COLOR_CACHE: dict = {}
+
+
+def parseLength(value) -> Length:
+    try:
+        return LENGTH_CACHE[value]
+    except KeyError:
         pass
+    except TypeError:  # unhashable, not a length anyway
+        logger.warning("Invalid length: %s", value)
+        return None
+
+    length = None
+    if isinstance(value, int):
+        length = ("cells", value)
+    elif isinstance(value, str):
+        if value.endswith("%") and value[:-1].isdigit():
+            length = ("percent", int(value[:-1]))
+        elif value.isdigit():
+            length = ("cells", int(value))
+        elif value != "auto":
+            logger.warning("Invalid length: %s", value)
+    elif value is not None:
+        logger.warning("Invalid length: %s", value)
+    LENGTH_CACHE[value] = length
+    return length
+
+
+# grid tracks are parsed to a tuple of (kind, value), kind is "cells",
+# "percent", "fr" or "auto".
+Track = tuple[Literal["cells", "percent", "fr", "auto"], int]
+
+TRACKS_CACHE: dict = {}
+
+
+def parseTracks(value) -> tuple[Track, ...] | None:
+    """
+    Parses a grid template, as "20 1fr 25%" or [20, "1fr", "25%"].
+    """
+    if isinstance(value, list):
+        value = tuple(value)
+    try:
+        return TRACKS_CACHE[value]
+    except KeyError:
+        pass
+    except TypeError:
+        logger.warning("Invalid grid template: %s", value)
+        return None
+
+    items = value.split() if isinstance(value, str) else value
+    if isinstance(items, int):
+        items = (items,)
+    tracks = []
+    for item in items or ():
+        if isinstance(item, str) and item.endswith("fr") and item[:-2].isdigit():
+            tracks.append(("fr", int(item[:-2])))
+        elif item == "auto":
+            tracks.append(("auto", 0))
+        else:
+            length = parseLength(item)
+            if length is None:
+                tracks = None
+                break
+            tracks.append(length)
+    tracks = tuple(tracks) if tracks else None
+    if tracks is None and value is not None:
+        logger.warning("Invalid grid template: %s", value)
+    TRACKS_CACHE[value] = tracks
+    return tracks
+
+
+def parseColor(value):
+    """
+    Resolves color names and #rrggbb into a (r, g, b) tuple.
+
+    Unknown colors are returned as is, the renderer decides.
+    """
+    try:
+        return COLOR_CACHE[value]
+    except KeyError:
+        pass
+
+    color = value
+    seen = set()
+    while isinstance(color, str) and color in defaults.COLORS and color not in seen:
+        seen.add(color)
+        color = defaults.COLORS[color]
+    if isinstance(color, str) and len(color) == 7 and color.startswith("#"):
+        try:
+            color = (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+        except ValueError:
+            color = value
+    if not isinstance(color, tuple):
+        color = value
+    COLOR_CACHE[value] = color
+    return color
+
+
+class ComputedStyle:
+    """
+    The resolved style of a component.
+
+    All the values are at `values`, as used by getStyle, including the ones
+    inherited from the parent style. The ones needed at layout and paint
+    are also at slots, already parsed, so the hot loops do neither dict
+    lookups nor string parsing.
+
+    `own` are the values from the stylesheet and inline style only, to
+    inherit again if the parent changes, and `inherited` what children
+    get from this style.
+    """
+
+    __slots__ = (
+        "own",
+        "values",
+        "inherited",
+        "color",
+        "background",
+        "borderColor",
+        "display",
+        "flexDirection",
+        "flexGrow",
+        "position",
+        "zIndex",
+        "width",
+        "height",
+        "minWidth",
+        "minHeight",
+        "maxWidth",
+        "maxHeight",
+        "left",
+        "top",
+        "gridColumns",
+        "gridRows",
+        "paddingTop",
+        "paddingRight",
+        "paddingBottom",
+        "paddingLeft",
+        "border",
+        "alignItems",
+        "alignSelf",
+        "justifySelf",
+        "fontWeight",
+        "fontDecoration",
+        "fontStyle",
+        "layoutKey",
+    )
+
+    def __init__(self, own: dict, parent: "ComputedStyle" = None):
+        self.own = own
+        if parent:
+            values = {
+                key: value
+                for key, value in zip(INHERITABLE_STYLES, parent.inherited)
+                if key not in own and value is not None
+            }
+            values.update(own)
+        else:
+            values = own
+        self.values = values
+        get = values.get
+        self.inherited = tuple(get(key) for key in INHERITABLE_STYLES)
+
+        self.color = parseColor(get("color"))
+        self.background = parseColor(get("background"))
+        self.borderColor = parseColor(get("borderColor"))
+
+        self.display = get("display")
+        self.flexDirection = get("flex-direction")
+        self.flexGrow = get("flex-grow")
+        self.position = get("position")
+        self.zIndex = get("zIndex")
+
+        self.width = parseLength(get("width"))
+        self.height = parseLength(get("height"))
+        self.minWidth = get("minWidth")
+        self.minHeight = get("minHeight")
+        self.maxWidth = get("maxWidth")
+        self.maxHeight = get("maxHeight")
+        self.left = parseLength(get("left"))
+        self.top = parseLength(get("top"))
+        self.gridColumns = parseTracks(get("grid-template-columns"))
+        self.gridRows = parseTracks(get("grid-template-rows"))
+
+        self.paddingTop = get("paddingTop") or 0
+        self.paddingRight = get("paddingRight") or 0
+        self.paddingBottom = get("paddingBottom") or 0
+        self.paddingLeft = get("paddingLeft") or 0
+        # only if there is border or not, the line width is at values
+        self.border = 1 if get("border") else 0
+
+        self.alignItems = get("align-items")
+        self.alignSelf = get("align-self")
+        self.justifySelf = get("justify-self")
+        self.fontWeight = get("font-weight")
+        self.fontDecoration = get("font-decoration")
+        self.fontStyle = get("font-style")
+
+        # if equal, a new style needs just a repaint, not a new layout
+        self.layoutKey = (
+            self.display,
+            self.flexDirection,
+            self.flexGrow,
+            self.position,
+            self.width,
+            self.height,
+            self.minWidth,
+            self.minHeight,
+            self.maxWidth,
+            self.maxHeight,
+            self.left,
+            self.top,
+            self.gridColumns,
+            self.gridRows,
+            self.paddingTop,
+            self.paddingRight,
+            self.paddingBottom,
+            self.paddingLeft,
+            self.border,
+            self.alignItems,
+            self.alignSelf,
+            self.justifySelf,
+        )
+
+    def __repr__(self):
+        return f"<ComputedStyle {self.values}>"
+
+
+class InvalidationSet:
+    """
+    Simple selectors (element, id, classes) of the rules that use a
+    pseudo class.
+
+    When that pseudo class state changes for a component, only needs a
+    new style if it matches any of these.
+    """
+
+    def __init__(self):
+        self.elements: set[str] = set()
+        self.ids: set[str] = set()
+        self.classes: set[str] = set()
+        self.universal = False
+
+    def copy(self):
+        ret = InvalidationSet()
+        ret.elements = set(self.elements)
+        ret.ids = set(self.ids)
+        ret.classes = set(self.classes)
+        ret.universal = self.universal
+        return ret
+
+    def add(self, selector: Selector):
+        if selector.id:
+            self.ids.add(selector.id)
+        elif selector.classes:
+            self.classes.update(selector.classes)
+        elif selector.element:
+            self.elements.add(selector.element)
+        else:
+            self.universal = True
+
+    def match(self, element: "retui.Component"):
+        if self.universal or element.name in self.elements:
+            return True
+        props = element.props
+        if self.ids and props.get("id") in self.ids:
+            return True
+        elcls = props.get("className")
+        if self.classes and elcls:
+            for cls in elcls.split():
+                if cls in self.classes:
+                    return True
+        return False
+
+
+class RuleIndex:
+    """
+    Buckets the rules by the most specific part of their selector, as
+    browsers do: id, then first class, then element name, else universal.
+
+    A lookup only has to try the rules of the buckets the element could
+    be in, instead of every rule in the stylesheet. Each rule keeps its
+    insertion order, as on same priority the last rule wins.
+
+    It can be layered on top of a base index, whose rules go first.
+    """
+
+    def __init__(self, base: "RuleIndex" = None):
+        self.byId: dict[str, list] = {}
+        self.byClass: dict[str, list] = {}
+        self.byElement: dict[str, list] = {}
+        self.universal: list = []
+        self.base = base
+        self.count = base.count if base else 0
+
+    def add(self, selector: Selector, style: dict):
+        rule = (self.count, selector, style)
+        self.count += 1
+        if selector.id:
+            self.byId.setdefault(selector.id, []).append(rule)
+        elif selector.classes:
+            self.byClass.setdefault(selector.classes[0], []).append(rule)
+        elif selector.element:
+            self.byElement.setdefault(selector.element, []).append(rule)
+        else:
+            self.universal.append(rule)
+
+    def candidates(self, element: "retui.Component"):
+        """
+        All the rules that may match the element, in no particular order.
+
+        Rules may be repeated if the element has repeated classes.
+        """
+        ret = self.universal
+        if self.base:
+            ret = self.base.candidates(element) + ret
+        rules = self.byElement.get(element.name)
+        if rules:
+            ret = ret + rules
+        props = element.props
+        elid = props.get("id")
+        if elid:
+            rules = self.byId.get(elid)
+            if rules:
+                ret = ret + rules
+        elcls = props.get("className")
+        if elcls:
+            byClass = self.byClass
+            for cls in elcls.split():
+                rules = byClass.get(cls)
+                if rules:
+                    ret = ret + rules
+        return ret
+
+
+class StyleSheet:
+    """
+    A set of rules. Can be layered on top of a base stylesheet, normally
+    DEFAULT_STYLESHEET, so its rules are not compiled again.
+    """
+
+    rules: list[tuple[Selector, dict]]
+    index: RuleIndex
+    # pseudo class -> InvalidationSet, for the pseudo class at the element
+    invalidationSets: dict[str, InvalidationSet]
+    # pseudo class -> InvalidationSet, for the pseudo class at an ancestor,
+    # so all the descendants may change
+    descendantInvalidationSets: dict[str, InvalidationSet]
+    # if any rule depends on the ancestors
+    hasAncestorRules: bool = False
+    # changes when rules are added, so cached styles are not reused
+    version: int = 0
+    # can not be changed, as it is shared
+    frozen: bool = False
+    # where the rules come from, to reload: ("dict", dict), ("css", text) or ("file", path, mtime)
+    sources: list[tuple]
+
+    def __init__(self, base: "StyleSheet" = None):
+        self.rules = []
+        self.sources = []
+        self.base = base
+        if base:
+            self.index = RuleIndex(base.index)
+            self.invalidationSets = {
+                k: v.copy() for k, v in base.invalidationSets.items()
+            }
+            self.descendantInvalidationSets = {
+                k: v.copy() for k, v in base.descendantInvalidationSets.items()
+            }
+            self.hasAncestorRules = base.hasAncestorRules
+        else:
+            self.index = RuleIndex()
+            self.invalidationSets = {}
+            self.descendantInvalidationSets = {}
+
+    def freeze(self):
+        self.frozen = True
+        self.rules = tuple(self.rules)
+        return self
+
+    def addCss(self, text: str):
+        self.sources.append(("css", text))
+        for selector, style in parseCss(text):
+            selector = Selector(selector)
+            if selector.priority < 0:
+                continue
+            self.addRule(selector, StyleSheet.normalizeStyle(style))
+
+    def addFile(self, path: str | os.PathLike):
+        """
+        Loads a .css file.
+
+        The compiled rules are cached on disk, by the file hash, so next
+        time neither parsing nor compiling is needed.
+        """
+        path = pathlib.Path(path)
+        self.sources.append(("file", path, path.stat().st_mtime))
+        data = path.read_bytes()
+        digest = hashlib.sha256(CSS_CACHE_VERSION + data).hexdigest()
+        cachefile = cacheDir() / f"{digest}.pickle"
+
+        rules = None
+        try:
+            with open(cachefile, "rb") as fd:
+                rules = pickle.load(fd)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.warning("Invalid css cache %s for %s", cachefile, path)
+
+        if rules is None:
+            rules = []
+            for selector, style in parseCss(data.decode()):
+                selector = Selector(selector)
+                if selector.priority < 0:
+                    continue
+                rules.append((selector, StyleSheet.normalizeStyle(style)))
+            try:
+                cachefile.parent.mkdir(parents=True, exist_ok=True)
+                tmpfile = cachefile.with_suffix(f".{os.getpid()}.tmp")
+                with open(tmpfile, "wb") as fd:
+                    pickle.dump(rules, fd)
+                os.replace(tmpfile, cachefile)
+            except OSError:
+                logger.warning("Could not write css cache %s", cachefile)
+
+        for selector, style in rules:
+            self.addRule(selector, style)
 
     def addDict(self, styles):
+        self.sources.append(("dict", styles))
         for selector, style in styles.items():
             selector = Selector(selector)
             if selector.priority < 0:
                 continue
-            style = StyleSheet.normalizeStyle(style)
-            self.rules.append((selector, style))
+            self.addRule(selector, StyleSheet.normalizeStyle(style))
+
+    def addRule(self, selector: Selector, style: dict):
+        """
+        Adds an already compiled selector and normalized style.
+        """
+        if self.frozen:
+            raise ValueError("Can not add rules to a frozen stylesheet")
+        self.version += 1
+        self.rules.append((selector, style))
+        self.index.add(selector, style)
+        for pseudo in selector.pseudo:
+            if pseudo not in self.invalidationSets:
+                self.invalidationSets[pseudo] = InvalidationSet()
+            self.invalidationSets[pseudo].add(selector)
+        for _is_child, ancestor in selector.ancestors:
+            self.hasAncestorRules = True
+            for pseudo in ancestor.pseudo:
+                if pseudo not in self.descendantInvalidationSets:
+                    self.descendantInvalidationSets[pseudo] = InvalidationSet()
+                self.descendantInvalidationSets[pseudo].add(ancestor)
+
+    def reload(self) -> list[tuple[Selector, set[str]]]:
+        """
+        If any of the .css files changed, loads all the rules again.
+
+        Returns the rules that changed, and which properties of them.
+        """
+        changed = False
+        for source in self.sources:
+            if source[0] == "file":
+                try:
+                    changed = source[1].stat().st_mtime != source[2]
+                except OSError:
+                    changed = False
+                if changed:
+                    break
+        if not changed:
+            return []
+
+        fresh = StyleSheet(self.base)
+        for source in self.sources:
+            try:
+                if source[0] == "file":
+                    fresh.addFile(source[1])
+                elif source[0] == "css":
+                    fresh.addCss(source[1])
+                else:
+                    fresh.addDict(source[1])
+            except OSError:
+                # maybe the editor is writing it, keep the old rules
+                logger.warning("Could not reload %s", source[1])
+                return []
+
+        prev = self.rules
+        self.rules = fresh.rules
+        self.sources = fresh.sources
+        self.index = fresh.index
+        self.invalidationSets = fresh.invalidationSets
+        self.descendantInvalidationSets = fresh.descendantInvalidationSets
+        self.hasAncestorRules = fresh.hasAncestorRules
+        self.version += fresh.version + 1
+        return diffRules(prev, self.rules)
+
+    def invalidatePseudo(self, pseudo: str, elements):
+        """
+        The pseudo class state changed for these elements, restyle the ones
+        that may be affected.
+        """
+        invalidation = self.invalidationSets.get(pseudo)
+        descendants = self.descendantInvalidationSets.get(pseudo)
+        if not invalidation and not descendants:
+            return
+        for element in elements:
+            if descendants and descendants.match(element):
+                element.invalidateStyle(subtree=True)
+            elif invalidation and invalidation.match(element):
+                element.invalidateStyle()
 
     @staticmethod
     def normalizeStyle(style):
+        """
+        Expands the shorthands (padding, border). Returns a new dict.
+        """
+        style = {**style}
         if "padding" in style:
             padding = style["padding"]
             top, right, bottom, left = split_421_item(padding)
@@ -143,18 +771,131 @@ class StyleSheet:
 
         return style
 
+    def computeStyle(self, component: "retui.Component"):
+        """
+        Resolves at once all the properties the rules set for the component.
+
+        As at getStyle, the rule with more priority wins, and on same
+        priority the last one. Falsy values are as if not set.
+        """
+        matches = []
+        for order, selector, style in self.index.candidates(component):
+            pri = selector.match(component)
+            if pri:
+                matches.append((pri, order, style))
+        matches.sort(key=lambda match: (match[0], match[1]))
+
+        values = {}
+        for _pri, _order, style in matches:
+            values.update(style)
+        return {key: value for key, value in values.items() if value}
+
     def getStyle(self, component: "retui.Component", key: str):
-        priority = -1
+        best = (-1, -1)
         value = None
-        for selector, style in self.rules:
+        for order, selector, style in self.index.candidates(component):
+            if key not in style:
+                continue
             pri = selector.match(component)
             # print(selector, pri, key, value)
-            if pri and pri >= priority and key in style:
+            if pri and (pri, order) >= best:
                 value = style[key]
-                priority = pri
+                best = (pri, order)
         return value
 
 
+def diffRules(prev, rules) -> list[tuple[Selector, set[str]]]:
+    """
+    Which selectors changed between two lists of rules, and which
+    properties of them.
+
+    Order breaks ties in the cascade, so a property is also changed for
+    the selectors that moved relative to others setting it, even if the
+    value is the same.
+    """
+
+    def bySelector(rules):
+        ret = {}
+        # {prop: {selector text: position of its last rule setting it}}
+        order = {}
+        for position, (selector, style) in enumerate(rules):
+            if selector.selector in ret:
+                ret[selector.selector][1].update(style)
+            else:
+                ret[selector.selector] = (selector, {**style})
+            for prop in style:
+                order.setdefault(prop, {})[selector.selector] = position
+        return ret, order
+
+    prev, prevorder = bySelector(prev)
+    rules, order = bySelector(rules)
+    changed = {}
+    for key in prev.keys() | rules.keys():
+        selector, prevstyle = prev.get(key) or (None, {})
+        selector, style = rules.get(key) or (selector, {})
+        keys = {
+            prop
+            for prop in prevstyle.keys() | style.keys()
+            if prevstyle.get(prop) != style.get(prop)
+        }
+        changed[key] = (selector, keys)
+
+    for prop in prevorder.keys() & order.keys():
+        # only the relative order of the ones in both, so an insertion
+        # does not move the rest
+        before = prevorder[prop]
+        after = order[prop]
+        common = before.keys() & after.keys()
+        before = sorted(common, key=before.get)
+        after = sorted(common, key=after.get)
+        for key, moved in zip(before, after):
+            if key != moved:
+                changed[key][1].add(prop)
+                changed[moved][1].add(prop)
+
+    return [(selector, keys) for selector, keys in changed.values() if keys]
+
+
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+CSS_BLOCK_RE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+# changing the compiled format must change this, so old caches are not used
+CSS_CACHE_VERSION = b"retui-css-1\n"
+
+
+def parseCss(text: str) -> list[tuple[str, dict]]:
+    """
+    Parses css text into a list of (selector, style).
+
+    Property names are kept as is (paddingTop, flex-direction...), and
+    numbers are converted to int.
+    """
+    text = CSS_COMMENT_RE.sub("", text)
+    rules = []
+    for match in CSS_BLOCK_RE.finditer(text):
+        selectors, declarations = match.groups()
+        style = {}
+        for declaration in declarations.split(";"):
+            if ":" not in declaration:
+                if declaration.strip():
+                    logger.warning("Invalid css declaration: %s", declaration)
+                continue
+            key, value = declaration.split(":", 1)
+            value = value.strip()
+            if len(value) > 1 and value[0] == value[-1] and value[0] in "\"'":
+                value = value[1:-1]
+            elif value.isdigit():
+                value = int(value)
+            style[key.strip()] = value
+        for selector in selectors.split(","):
+            rules.append((selector.strip(), style))
+    return rules
+
+
+def cacheDir() -> pathlib.Path:
+    cache = os.environ.get("XDG_CACHE_HOME") or pathlib.Path.home() / ".cache"
+    return pathlib.Path(cache) / "retui"
+
+
 def split_421_item(item):
     items = [int(x) for x in str(item).split()]
     if len(items) == 1:
@@ -168,3 +909,9 @@ def split_421_item(item):
         return items[0], items[1], items[2], items[3]
 
     return items
+
+
+# compiled once, and shared by all documents
+DEFAULT_STYLESHEET = StyleSheet()
+DEFAULT_STYLESHEET.addDict(defaults.DEFAULT_CSS)
+DEFAULT_STYLESHEET.freeze()
@@ -1,3 +1,4 @@
+import contextlib
 import logging
 
 from retui import css, defaults
@@ -24,24 +25,61 @@ class Document(HandleEventTrait, Component):
     A component with some extra methods
     """
 
-    currentFocusedElement = None
+    _currentFocusedElement = None
+    # the focused element and all its parents, all of them are :focus
+    focusPath: set[Component]
     # current open element normally a select. Click outside and it is closed. And only one at a time.
     currentOpenElement = None
     name = "document"
     stylesheet: css.StyleSheet
     stopLoop: None | EventExit = None
-    cache = {}
-
-    def __init__(self, renderer=None, children=None, *, stylesheet=None, **props):
-        self.stylesheet = css.StyleSheet()
-        self.stylesheet.addDict(defaults.DEFAULT_CSS)
+    # some style was invalidated, see calculateStyles
+    stylesPending: bool = True
+    # calculateStyles passes done, to reset the Component.childStyleCache
+    stylePass: int = 0
+    # something changed the layout, see Component.setLayoutDirty
+    layoutPending: bool = True
+    # relayout boundaries with some dirty descendant, see Component.setLayoutDirty
+    layoutRoots: set[Component]
+    # screen size of the last layout
+    layoutViewport: tuple[int, int] = None
+    # reload the .css files when they change
+    watchStylesheets: bool = False
+    # seconds between checks of the .css files, if watchStylesheets
+    watchInterval: float = 0.5
+    # components that must render again, see Component.setChanged
+    renderQueue: set[Component]
+    # the ones at dormant subtrees, queued again when awaken. See wakeDormant
+    dormantQueue: set[Component]
+    # nested batches running, and the components with new state in them
+    batchUpdates: int = 0
+    pendingUpdates: set[Component]
+
+    def __init__(
+        self,
+        renderer=None,
+        children=None,
+        *,
+        stylesheet=None,
+        watchStylesheets=False,
+        **props,
+    ):
+        self.focusPath = set()
+        self.layoutRoots = set()
+        self.renderQueue = {self}
+        self.dormantQueue = set()
+        self.pendingUpdates = set()
+        self.watchStylesheets = watchStylesheets
+        self.stylesheet = css.StyleSheet(base=css.DEFAULT_STYLESHEET)
         if children:
             props = {
                 **props,
                 "children": children,
             }
-        if stylesheet:
+        if isinstance(stylesheet, dict):
             self.stylesheet.addDict(stylesheet)
+        elif stylesheet:  # a .css file path
+            self.stylesheet.addFile(stylesheet)
         super().__init__(**props)
         self.props = {
             "on_keypress": self.on_keypress,
@@ -55,12 +93,28 @@ class Document(HandleEventTrait, Component):
 
         self.materialize()
 
+    @property
+    def currentFocusedElement(self):
+        return self._currentFocusedElement
+
+    @currentFocusedElement.setter
+    def currentFocusedElement(self, el):
+        """
+        The :focus state is for the element and all its parents. Only the
+        ones that enter or leave the focus path, and have some :focus rule,
+        need a new style.
+        """
+        self._currentFocusedElement = el
+        prev = self.focusPath
+        self.focusPath = set(el.parentTraversal()) if el else set()
+        self.stylesheet.invalidatePseudo("focus", prev ^ self.focusPath)
+
     def isFocusable(self):
         return False
 
     def nextFocus(self):
         prev = self.currentFocusedElement
-        for child in self.preorderTraversal():
+        for child in self.preorderTraversal(skipHidden=True):
             if child.isFocusable():
                 if prev is None:
                     return self.setFocus(child)
@@ -71,7 +125,7 @@ class Document(HandleEventTrait, Component):
     def prevFocus(self):
         current = self.currentFocusedElement
         prev = None
-        for child in self.preorderTraversal():
+        for child in self.preorderTraversal(skipHidden=True):
             if child.isFocusable():
                 if current is child:
                     current = prev
@@ -91,7 +145,13 @@ class Document(HandleEventTrait, Component):
         return el
 
     def setOpenElement(self, el):
+        prev = self.currentOpenElement
         self.currentOpenElement = el
+        self.stylesheet.invalidatePseudo("open", [x for x in (prev, el) if x])
+        # may render different when open
+        for x in (prev, el):
+            if x:
+                x.setChanged()
 
     def on_keypress(self, event: EventKeyPress):
         if event.keycode == "TAB":
@@ -147,11 +207,205 @@ class Document(HandleEventTrait, Component):
             return
 
     def findElementAt(self, x: int, y: int):
+        """
+        The component at the position, as painted. If not painted since
+        the last layout, searches the tree.
+        """
+        renderer = self.renderer
+        if renderer.owners is not None:
+            return renderer.ownerAt(x, y)
         _z, el = super().findElementAt(x, y)
         return el
 
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        The state updates inside are applied at once, but the components
+        are marked to render and layout again only once, at the end, as
+        when handlers of several events set state many times.
+        """
+        self.batchUpdates += 1
+        try:
+            yield
+        finally:
+            self.batchUpdates -= 1
+            if not self.batchUpdates:
+                pending = self.pendingUpdates
+                self.pendingUpdates = set()
+                for item in pending:
+                    item.setChanged()
+                    item.setLayoutDirty()
+
+    def materialize(self):
+        """
+        Renders the components queued since the last materialize, parents
+        first, and what changes with their new output. The rest of the
+        tree is not visited, so a change costs as the changed subtree.
+
+        Components at dormant subtrees wait at dormantQueue until awaken,
+        so they do not keep the loop busy.
+
+        What changes while mounting, as state loaded at componentDidMount,
+        renders in this same call.
+        """
+        rendered = 0
+        while self.renderQueue:
+            queue = self.renderQueue
+            self.renderQueue = set()
+            rendered += self.materializeQueue(queue)
+        self.renderCount = rendered
+        return self
+
+    def wakeDormant(self):
+        """
+        Some subtree is not dormant any more. Its waiting components are
+        queued again; the ones still at dormant subtrees go back to wait.
+        """
+        self.renderQueue |= self.dormantQueue
+        self.dormantQueue = set()
+
+    def materializeQueue(self, queue):
+        items = []
+        # {component: (depth, at a dormant subtree)}, so paths are walked once
+        found = {self: (0, False)}
+        for item in queue:
+            path = []
+            node = item
+            while node not in found and node is not None and node.document is self:
+                path.append(node)
+                node = node.parent
+            if node not in found:  # not at the document any more
+                continue
+            depth, hidden = found[node]
+            for node in reversed(path):
+                depth += 1
+                hidden = hidden or bool(node.props.get("dormant"))
+                found[node] = (depth, hidden)
+            if hidden:
+                self.dormantQueue.add(item)
+                continue
+            items.append((depth, item))
+        items.sort(key=lambda x: x[0])
+
+        rendered = 0
+        for _depth, item in items:
+            if not self.isAttached(item):
+                # removed by a parent rendered before
+                continue
+            # if already rendered by its parent, does nothing
+            Component.materialize(item)
+            rendered += item.renderCount
+        return rendered
+
+    def isAttached(self, item: Component):
+        """
+        If still at this document. Removed components are detached only
+        at the top of the removed subtree, so checks up to the document.
+        """
+        while item is not None and item.document is self:
+            if item is self:
+                return True
+            item = item.parent
+        return False
+
+    def calculateStyles(self):
+        """
+        Resolves the styles top-down before layout.
+
+        Only visits the components whose style was invalidated, and their
+        children while the inherited values keep changing, so each
+        component inherits in O(1) from its already resolved parent.
+        """
+        self.stylesPending = False
+        self.stylePass += 1
+        stack = [(self, False, False)]
+        while stack:
+            item, parentChanged, force = stack.pop()
+            parent = item.parent
+            parentStyle = parent and parent.getComputedStyle()
+            if force or item.computedStyle is None:
+                item.computeStyle(parentStyle)
+                changed = True
+            elif parentChanged:
+                changed = item.inheritStyle(parentStyle)
+            else:
+                changed = False
+
+            if item.styleDirtySubtree:
+                item.styleDirtySubtree = False
+                force = True
+            if changed or force or item.styleDirtyDescendants:
+                item.styleDirtyDescendants = False
+                for child in item.children:
+                    stack.append((child, changed, force))
+
+    def reloadStylesheets(self):
+        """
+        Loads again the changed .css files, and restyles only the
+        components the changed rules may match.
+
+        Only if a layout style changed, the layout is calculated again,
+        else it is just a repaint.
+        """
+        changed = self.stylesheet.reload()
+        if not changed:
+            return False
+        selectors = [selector for selector, _keys in changed]
+        for item in self.preorderTraversal():
+            if isinstance(item.props.get("style"), Component):
+                continue
+            # matching the compound part is enough, ancestors may have changed too
+            if any(selector.matchCompound(item) for selector in selectors):
+                item.invalidateStyle()
+        return True
+
     def calculateLayout(self):
-        self.calculateLayoutSizes(0, 0, self.renderer.width, self.renderer.height)
+        """
+        Calculates the sizes only of the dirty components, from the
+        document or their relayout boundary, and then all the positions.
+        """
+        self.calculateStyles()
+        self.layoutPending = False
+        # until painted again
+        self.renderer.owners = None
+        roots = self.layoutRoots
+        self.layoutRoots = set()
+        # on resizes, only what depends on the size changes its measureKey
+        self.layoutViewport = (self.renderer.width, self.renderer.height)
+        self.measure(0, 0, self.renderer.width, self.renderer.height)
+
+        # parents first, so they may do the children ones too
+        paths = sorted(
+            (list(root.parentTraversal()) for root in roots if root.layoutDirty),
+            key=len,
+        )
+        for path in paths:
+            root = path[0]
+            if not root.layoutDirty or path[-1] is not self:
+                # already done, or removed
+                continue
+            if any(node.isHidden() for node in path):
+                # until shown again
+                self.layoutRoots.add(root)
+                continue
+            if root.layoutConstraints is None:
+                # never measured, do it from the document
+                for node in path:
+                    node.layoutDirty = True
+                self.measure(0, 0, self.renderer.width, self.renderer.height)
+                continue
+            # keep the size as the parent left it (stretch), if it did not change
+            width = root.layout.width
+            height = root.layout.height
+            size = root.measuredSize
+            if root.measure(*root.layoutConstraints) == size:
+                root.layout.width = width
+                root.layout.height = height
+            if root.overflows:
+                # the parents were not measured again, so do not know
+                for node in path[1:]:
+                    node.overflows = True
+
         self.layout.y = 0
         self.layout.x = 0
         self.calculateLayoutPosition()
@@ -159,11 +413,18 @@ class Document(HandleEventTrait, Component):
         return self
 
     def paint(self, renderer: Renderer):
-        self.calculateLayout()
-
-        renderer.setBackground(self.getStyle("background"))
-        renderer.setForeground(self.getStyle("color"))
+        self.calculateStyles()
+        if self.layoutPending or self.layoutViewport != (
+            renderer.width,
+            renderer.height,
+        ):
+            self.calculateLayout()
+
+        style = self.getComputedStyle()
+        renderer.setBackground(style.background)
+        renderer.setForeground(style.color)
         renderer.fillRect(0, 0, renderer.width, renderer.height)
+        renderer.clearOwners()
 
         super().paint(renderer)
         assert len(renderer.translateStack) == 0
@@ -171,7 +432,6 @@ class Document(HandleEventTrait, Component):
 
         # super().paint(renderer)
         self.setCursor(renderer)
-        self.cache = {}
         renderer.flush()
 
     def setCursor(self, renderer: Renderer):
@@ -207,22 +467,35 @@ class Document(HandleEventTrait, Component):
     def loop(self):
         renderer = self.renderer
         self.stopLoop = None
+        timeout = self.watchInterval if self.watchStylesheets else None
+        # events since the last frame
+        events = True
         while not self.stopLoop:
-            self.materialize()
-            self.paint(renderer)
+            if self.watchStylesheets:
+                self.reloadStylesheets()
+            # one frame for all the events read at once
+            if events or self.renderQueue or self.stylesPending or self.layoutPending:
+                self.materialize()
+                logger.debug("Frame: %d components rendered", self.renderCount)
+                self.paint(renderer)
+            events = False
             try:
-                for ev in renderer.readEvents():
-                    if (
-                        ev.name == "keypress"
-                        and ev.keycode == defaults.BREAKPOINT_KEYPRESS
-                    ):
-                        renderer.breakpoint(
-                            callback=lambda: self.prettyPrint(), document=self
-                        )
-                    elif isinstance(ev, EventExit):
-                        return ev
-                    else:
-                        self.on_event(ev)
+                # if some component changed while mounting, do not wait
+                wait = 0 if self.renderQueue else timeout
+                with self.batch():
+                    for ev in renderer.readEvents(timeout=wait):
+                        events = True
+                        if (
+                            ev.name == "keypress"
+                            and ev.keycode == defaults.BREAKPOINT_KEYPRESS
+                        ):
+                            renderer.breakpoint(
+                                callback=lambda: self.prettyPrint(), document=self
+                            )
+                        elif isinstance(ev, EventExit):
+                            return ev
+                        else:
+                            self.on_event(ev)
             except KeyboardInterrupt:
                 self.close()
                 raise
@@ -0,0 +1,188 @@
+"""
+Struct of arrays storage for the component layouts.
+
+Instead of a Layout object per component, x, y, width and height of all
+of them are at four contiguous array('i'), and the constraints they were
+measured with at four more. Each component layout is a LayoutView into
+them. Enable it before creating the components:
+
+    retui.layoutstore.useLayoutStore(LayoutStore())
+
+If numpy is available, the positions of long lists of children, as
+tables, are calculated at once over the arrays.
+"""
+
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# below this many children, the plain loop is faster than numpy
+VECTORIZE_MIN_CHILDREN = 32
+# at minWidth, not measured yet. Constraints are never negative
+NO_CONSTRAINTS = -1
+
+
+class LayoutStore:
+    def __init__(self, capacity: int = 1024, vectorize: bool = True):
+        self.capacity = 0
+        self.x = array("i")
+        self.y = array("i")
+        self.width = array("i")
+        self.height = array("i")
+        # the constraints, see Component.layoutConstraints
+        self.minWidth = array("i")
+        self.minHeight = array("i")
+        self.maxWidth = array("i")
+        self.maxHeight = array("i")
+        # free indexes, lowest last
+        self.free: list[int] = []
+        self.vectorize = vectorize and numpy is not None
+        self.grow(capacity)
+
+    def __len__(self):
+        return self.capacity - len(self.free)
+
+    def grow(self, size: int):
+        zeros = array("i", bytes(size * self.x.itemsize))
+        for values in (self.x, self.y, self.width, self.height):
+            values.extend(zeros)
+        for values in (self.minHeight, self.maxWidth, self.maxHeight):
+            values.extend(zeros)
+        self.minWidth.extend(array("i", [NO_CONSTRAINTS]) * size)
+        self.free[:0] = range(self.capacity + size - 1, self.capacity - 1, -1)
+        self.capacity += size
+
+    def view(self) -> "LayoutView":
+        if not self.free:
+            self.grow(self.capacity)
+        return LayoutView(self, self.free.pop())
+
+    def release(self, index: int):
+        self.x[index] = self.y[index] = self.width[index] = self.height[index] = 0
+        self.minWidth[index] = NO_CONSTRAINTS
+        self.free.append(index)
+
+    def flowPositions(self, indexes: list[int], x: int, y: int, row: bool):
+        """
+        Places the layouts at indexes one after the other from (x, y), to
+        the right if row, else down.
+        """
+        idx = numpy.array(indexes, dtype=numpy.intp)
+        xs = numpy.frombuffer(self.x, dtype=numpy.intc)
+        ys = numpy.frombuffer(self.y, dtype=numpy.intc)
+        if row:
+            sizes = numpy.frombuffer(self.width, dtype=numpy.intc)[idx]
+            flow, fixed = xs, ys
+            start, other = x, y
+        else:
+            sizes = numpy.frombuffer(self.height, dtype=numpy.intc)[idx]
+            flow, fixed = ys, xs
+            start, other = y, x
+        offsets = numpy.cumsum(sizes) - sizes
+        flow[idx] = offsets + start
+        fixed[idx] = other
+        # numpy views must not outlive this call, or the arrays can not grow
+        del xs, ys, flow, fixed
+
+
+class LayoutView:
+    """
+    The layout of a component, stored at a LayoutStore. Same interface
+    as component.Layout.
+    """
+
+    __slots__ = ("store", "index")
+
+    def __init__(self, store: LayoutStore, index: int):
+        self.store = store
+        self.index = index
+
+    def __del__(self):
+        self.store.release(self.index)
+
+    def __repr__(self):
+        return (
+            f"LayoutView(x={self.x}, y={self.y}, "
+            f"width={self.width}, height={self.height})"
+        )
+
+    @property
+    def x(self):
+        return self.store.x[self.index]
+
+    @x.setter
+    def x(self, value):
+        self.store.x[self.index] = value
+
+    @property
+    def y(self):
+        return self.store.y[self.index]
+
+    @y.setter
+    def y(self, value):
+        self.store.y[self.index] = value
+
+    @property
+    def width(self):
+        return self.store.width[self.index]
+
+    @width.setter
+    def width(self, value):
+        self.store.width[self.index] = value
+
+    @property
+    def height(self):
+        return self.store.height[self.index]
+
+    @height.setter
+    def height(self, value):
+        self.store.height[self.index] = value
+
+    @property
+    def constraints(self):
+        store = self.store
+        index = self.index
+        min_width = store.minWidth[index]
+        if min_width == NO_CONSTRAINTS:
+            return None
+        return (
+            min_width,
+            store.minHeight[index],
+            store.maxWidth[index],
+            store.maxHeight[index],
+        )
+
+    @constraints.setter
+    def constraints(self, value):
+        store = self.store
+        index = self.index
+        if value is None:
+            store.minWidth[index] = NO_CONSTRAINTS
+            return
+        (
+            store.minWidth[index],
+            store.minHeight[index],
+            store.maxWidth[index],
+            store.maxHeight[index],
+        ) = value
+
+    def inside(self, x, y):
+        return (self.x <= x < (self.x + self.width)) and (
+            self.y <= y < (self.y + self.height)
+        )
+
+    def as_clipping(self):
+        return ((self.x, self.y), (self.x + self.width, self.y + self.height))
+
+
+def useLayoutStore(store: LayoutStore | None):
+    """
+    Components created from now on keep their layout at the store. None
+    to go back to a Layout per component.
+    """
+    from retui.component import Component
+
+    Component.layoutStore = store
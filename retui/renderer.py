@@ -68,6 +68,9 @@ class Renderer:
     translate = (0, 0)
     clipping = ((0, 0), (80, 25))
     zIndex = 0
+    # per cell, the component painted there and its zIndex. See setOwner
+    owners: list = None
+    ownersZIndex: list = None
     translateStack = []
     clippingStack = []
     stdout = sys.stdout
@@ -152,6 +155,47 @@ class Renderer:
 
         self.screen[pos] = char.update(zIndex=self.zIndex)
 
+    def clearOwners(self):
+        size = self.width * self.height
+        self.owners = [None] * size
+        self.ownersZIndex = [-(2**31)] * size
+
+    def setOwner(self, owner, x, y, width, height, z_index):
+        """
+        Marks the rectangle, translated and clipped as the painting, as
+        owned by this component, where no other with more zIndex is.
+
+        Later ones on same zIndex win, as children over their parents.
+        """
+        x += self.translate[0]
+        y += self.translate[1]
+        (left, top), (right, bottom) = self.clipping
+        x, mx = max(x, left, 0), min(x + width, right, self.width)
+        y, my = max(y, top, 0), min(y + height, bottom, self.height)
+        if x >= mx:
+            return
+        owners = self.owners
+        zindexes = self.ownersZIndex
+        for h in range(y, my):
+            start = self.pos(x, h)
+            end = start + mx - x
+            if max(zindexes[start:end]) <= z_index:
+                owners[start:end] = [owner] * (end - start)
+                zindexes[start:end] = [z_index] * (end - start)
+                continue
+            for p in range(start, end):
+                if zindexes[p] <= z_index:
+                    owners[p] = owner
+                    zindexes[p] = z_index
+
+    def ownerAt(self, x, y):
+        """
+        The component painted at the position, as of the last paint.
+        """
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.owners[self.pos(x, y)]
+        return None
+
     def setCursor(self, x, y):
         x += self.translate[0]
         y += self.translate[1]
@@ -239,7 +283,10 @@ class Renderer:
             self.drawChar(p, ny, sc.update(char=table_chars[5]))
         self.drawChar(x + width - 1, ny, sc.update(char=table_chars[6]))
 
-    def readEvents(self) -> Generator[Event, None, None]:
+    def readEvents(self, timeout: float = None) -> Generator[Event, None, None]:
+        """
+        Waits for events up to timeout seconds, or forever if None.
+        """
         return []
 
     def flush(self):
@@ -328,9 +375,35 @@ class Renderer:
         """
         self.stdout.write(strlist_to_str(str_or_list))
 
+    def resize(self, width: int, height: int):
+        """
+        The screen size changed. The buffers keep what they had where the
+        old and new sizes overlap, so only what changes is written again,
+        and the document layout is calculated again only where it depends
+        on the screen size.
+        """
+        if width == self.width and height == self.height:
+            return
+        for screen in (self.screen, self.screen_back):
+            rows = [
+                screen[y * self.width : y * self.width + min(width, self.width)]
+                for y in range(min(height, self.height))
+            ]
+            screen[:] = []
+            for y in range(height):
+                row = rows[y] if y < len(rows) else []
+                screen.extend(row)
+                screen.extend(ScreenChar() for _ in range(width - len(row)))
+        self.width = width
+        self.height = height
+        self.clipping = ((0, 0), (width, height))
+        self.owners = None
+        if self.document:
+            self.document.paint(self)
+
     def redraw(self):
         """
-        Ask the document to redraw. Needed for terminal size changes.
+        Ask the document to redraw, as after the terminal was cleared.
 
         This invalidates all double buffering.
         """
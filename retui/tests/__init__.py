@@ -2,3 +2,4 @@ from .component import ComponentTestCase
 from .widgets import WidgetsTestCase
 from .css import CssTestCase
 from .events import EventsTestCase
+from .layoutstore import LayoutStoreTestCase
@@ -1,10 +1,11 @@
 import logging
-from unittest import TestCase
-from retui.component import Component, Text
+from unittest import TestCase, mock
+from retui.component import Component, Scrollable, Text
 from retui.css import Selector
 from retui.document import Document
+from retui.events import EventKeyPress
 from retui.tests.utils import printLayout
-from retui.widgets import div, span, input
+from retui.widgets import button, div, span, input
 
 logger = logging.getLogger(__name__)
 
@@ -264,3 +265,496 @@ class ComponentTestCase(TestCase):
         app.prettyPrint()
 
         self.assertEqual(app.queryElement("Text").layout.width, 4)
+
+    def test_incremental_layout(self):
+        class Counter(Component):
+            state = {"count": 0}
+
+            def render(self):
+                return Text(f"Count {self.state['count']}")
+
+        counter = Counter()
+        app = Document()[
+            div(id="box", style={"width": 20, "height": 3})[counter],
+            div(id="other")["Other"],
+        ]
+        app.materialize().calculateLayout()
+        self.assertFalse(app.layoutPending)
+
+        measured = []
+        layoutSizes = Component.layoutSizes
+
+        def trace(self, *args, **kwargs):
+            measured.append(self)
+            return layoutSizes(self, *args, **kwargs)
+
+        box = app.queryElement("#box")
+        with mock.patch.object(Component, "layoutSizes", trace):
+            counter.setState({"count": 1000})
+            app.materialize()
+            self.assertEqual(app.layoutRoots, {box})
+            app.calculateLayout()
+
+        # only up to the fixed size box
+        self.assertEqual(measured, [box, counter])
+        self.assertEqual(counter.children[0].layout.width, 10)
+        self.assertEqual(box.layout.width, app.layout.width)
+
+        # a change outside a boundary goes up to the document
+        app.queryElement("#other").setLayoutDirty()
+        self.assertEqual(app.layoutRoots, {app})
+
+    def test_measure_cache(self):
+        app = Document()[div(id="box")["Some text here"]]
+        app.materialize().calculateLayout()
+        box = app.queryElement("#box")
+
+        self.assertEqual(box.measure(0, 0, 20, 5), (14, 1))
+        self.assertEqual(box.measure(0, 0, 4, 5), (4, 1))
+        with mock.patch.object(
+            div, "layoutSizes", side_effect=AssertionError
+        ):
+            # same as last
+            self.assertEqual(box.measure(0, 0, 4, 5), (4, 1))
+        self.assertEqual(box.layout.width, 4)
+
+        box.children[0].setLayoutDirty()
+        self.assertTrue(box.layoutDirty)
+        with mock.patch.object(div, "layoutSizes", return_value=(1, 1)):
+            self.assertEqual(box.measure(0, 0, 4, 5), (1, 1))
+        self.assertEqual(box.measuredSize, (1, 1))
+
+    def test_deep_tree(self):
+        # more than the recursion limit would allow if recursive
+        tree = Text("Deep")
+        for _ in range(600):
+            tree = div()[tree]
+        app = Document()[tree]
+        app.materialize()
+        app.renderer.height = 1
+        app.paint(app.renderer)
+
+        self.assertEqual(app.queryElement("Text").layout.width, 4)
+        self.assertEqual(app.findElementAt(0, 0).name, "Text")
+        self.assertEqual(len(list(app.preorderTraversal())), 602)
+
+    def test_resize_layout(self):
+        app = Document()[
+            div(id="fixed", style={"width": 20, "height": 3})[div()["Fixed"]],
+            div(id="half", style={"width": "50%"})["Half"],
+        ]
+        app.materialize()
+        renderer = app.renderer
+        app.paint(renderer)
+        marker = renderer.screen_back[renderer.width + 1]
+
+        measured = []
+        layoutSizes = Component.layoutSizes
+
+        def trace(self, *args, **kwargs):
+            measured.append(self.props.get("id"))
+            return layoutSizes(self, *args, **kwargs)
+
+        with mock.patch.object(Component, "layoutSizes", trace):
+            renderer.resize(100, 30)
+
+        # the fixed size one keeps its layout
+        self.assertEqual(measured, [None, "half"])
+        self.assertEqual(app.queryElement("#half").layout.width, 50)
+        self.assertEqual(app.queryElement("#fixed").layout.height, 3)
+        self.assertEqual(len(renderer.screen), 100 * 30)
+        self.assertEqual(len(renderer.screen_back), 100 * 30)
+        # buffers are kept where they overlap
+        self.assertTrue(
+            renderer.screen[101] is marker or renderer.screen_back[101] is marker
+        )
+
+    def test_grid_layout(self):
+        style = {
+            "display": "grid",
+            "width": 80,
+            "height": 20,
+            "grid-template-columns": "10 1fr 1fr 25%",
+            "grid-template-rows": "2 1fr 1fr",
+        }
+        app = Document()[
+            div(id="grid", style=style)[
+                [div(id=f"panel{n}")[f"Panel {n}"] for n in range(16)]
+            ]
+        ]
+        app.materialize()
+        app.calculateLayout()
+
+        grid = app.queryElement("#grid")
+        # the last row is not at the template, so it is as its content
+        self.assertEqual(grid.gridTracks, ((10, 25, 25, 20), [2, 8, 8, 1]))
+        panel = app.queryElement("#panel10")
+        self.assertEqual(
+            (panel.layout.x, panel.layout.y, panel.layout.width, panel.layout.height),
+            (35, 10, 25, 8),
+        )
+        panel = app.queryElement("#panel15")
+        self.assertEqual(
+            (panel.layout.x, panel.layout.y, panel.layout.width, panel.layout.height),
+            (60, 18, 20, 1),
+        )
+
+        # bare text and spans as cells
+        style = {"display": "grid", "grid-template-columns": "1fr 1fr"}
+        app = Document()[
+            div(id="grid", style=style)["hello", span(id="label")["world"]]
+        ]
+        app.materialize()
+        app.paint(app.renderer)
+        grid = app.queryElement("#grid")
+        hello = grid.children[0]
+        label = app.queryElement("#label")
+        half = app.renderer.width // 2
+        self.assertEqual((hello.layout.x, hello.layout.width), (0, half))
+        self.assertEqual((label.layout.x, label.layout.width), (half, half))
+        self.assertEqual(label.children[0].layout.x, half)
+
+    def test_hidden_subtrees(self):
+        class Panel(Component):
+            mounts = 0
+
+            def componentDidMount(self):
+                self.mounts += 1
+
+            def render(self):
+                return button(on_click=lambda ev: None)[self.props["title"]]
+
+        class Tabs(Component):
+            state = {"tab": "one"}
+
+            def render(self):
+                tab = self.state["tab"]
+                return [
+                    div(id="one", dormant=tab != "one")[Panel(title="One")],
+                    div(id="two", dormant=tab != "two")[Panel(title="Two")],
+                    div(id="hidden", style={"display": "none"})["Hidden"],
+                ]
+
+        tabs = Tabs()
+        app = Document()[tabs]
+        app.materialize()
+        one = app.queryElement("Panel")
+        self.assertEqual(one.mounts, 1)
+        tabs.setState({"tab": "two"})
+        app.materialize()
+        tabs.setState({"tab": "one"})
+        app.materialize()
+
+        # kept while dormant, not mounted again
+        self.assertIs(app.queryElement("Panel"), one)
+        self.assertEqual(one.mounts, 1)
+
+        with mock.patch.object(app.renderer, "fillText") as fillText:
+            app.paint(app.renderer)
+        painted = [call.args[0] for call in fillText.call_args_list]
+        self.assertIn("One", painted)
+        self.assertNotIn("Two", painted)
+        self.assertNotIn("Hidden", painted)
+
+        for id in ("#two", "#hidden"):
+            layout = app.queryElement(id).layout
+            self.assertEqual((layout.width, layout.height), (0, 0))
+        self.assertIn(one, app.findElementAt(0, 0).parentTraversal())
+
+        first = app.nextFocus() or app.currentFocusedElement
+        app.nextFocus()
+        self.assertIs(app.currentFocusedElement, None)
+        self.assertIs(first.parent, one)
+
+    def test_offscreen_culling(self):
+        scroll = Scrollable()[
+            [div(id=f"row{n}")[f"Row {n}"] for n in range(100)]
+        ]
+        app = Document()[scroll]
+        app.materialize()
+        scroll.scrollTo(0, 50)
+
+        with mock.patch.object(app.renderer, "fillText") as fillText:
+            app.paint(app.renderer)
+        painted = [
+            call.args[0]
+            for call in fillText.call_args_list
+            if call.args[0].startswith("Row")
+        ]
+        # only the visible rows
+        visible = range(50, 50 + scroll.layout.height)
+        self.assertEqual(painted, [f"Row {n}" for n in visible])
+
+    def test_scroll_paint_only(self):
+        scroll = Scrollable()[[div()[f"Row {n}"] for n in range(50)]]
+        app = Document()[scroll]
+        app.materialize()
+        app.paint(app.renderer)
+
+        with mock.patch.object(Component, "layoutSizes") as layoutSizes:
+            scroll.handleKeyPress(EventKeyPress("DOWN"))
+            self.assertFalse(app.layoutPending)
+            with mock.patch.object(app.renderer, "fillText") as fillText:
+                app.paint(app.renderer)
+        layoutSizes.assert_not_called()
+        self.assertEqual(scroll.scrollY, 1)
+        self.assertEqual(fillText.call_args_list[0].args[0], "Row 1")
+
+    def test_scroll_progressive_layout(self):
+        rows = 10000
+        scroll = Scrollable()[[div()[f"Row {n}", "more"] for n in range(rows)]]
+        app = Document()[scroll]
+        app.materialize()
+        app.paint(app.renderer)
+
+        def measured():
+            return [n for n, row in enumerate(scroll.children) if not row.layoutDirty]
+
+        # only around the viewport, the rest estimated as those
+        self.assertLess(len(measured()), 3 * scroll.layout.height)
+        self.assertEqual(scroll.innerLayout.height, rows * 2)
+
+        scroll.scrollTo(0, 9000 * 2)
+        with mock.patch.object(app.renderer, "fillText") as fillText:
+            app.paint(app.renderer)
+        self.assertIn(9000, measured())
+        self.assertEqual(fillText.call_args_list[0].args[0], "Row 9000")
+        self.assertLess(len(measured()), 6 * scroll.layout.height)
+
+    def test_scroll_measure_error(self):
+        scroll = Scrollable()[[div()[f"Row {n}"] for n in range(50)]]
+        app = Document()[scroll]
+        app.materialize()
+        app.paint(app.renderer)
+
+        with mock.patch.object(Scrollable, "measureRows", side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                app.paint(app.renderer)
+        # the translate and clipping stacks are left as they were
+        self.assertEqual(app.renderer.translateStack, [])
+        self.assertEqual(app.renderer.clippingStack, [])
+        app.paint(app.renderer)
+
+    def test_hit_test_map(self):
+        overlay = {
+            "position": "absolute",
+            "zIndex": 10,
+            "left": 5,
+            "top": 0,
+            "width": 10,
+            "height": 1,
+        }
+        scroll = Scrollable()[[div(id=f"row{n}")[f"Row {n}"] for n in range(50)]]
+        app = Document()[
+            div(id="overlay", style=overlay)["Overlay"],
+            div(id="top", style={"width": 20})["Top"],
+            scroll,
+        ]
+        app.materialize()
+        scroll.scrollTo(0, 10)
+        app.paint(app.renderer)
+
+        with mock.patch.object(Component, "findElementAt") as findElementAt:
+            top = app.findElementAt(0, 0)
+            over = app.findElementAt(6, 0)
+            row = app.findElementAt(0, scroll.layout.y)
+        findElementAt.assert_not_called()
+        self.assertEqual(top.parent.props.get("id"), "top")
+        self.assertEqual(over.parent.props.get("id"), "overlay")
+        # translated as painted
+        self.assertEqual(row.parent.props.get("id"), "row10")
+
+    def test_change_tracking(self):
+        rendered = []
+
+        class Counter(Component):
+            state = {"count": 0}
+
+            def render(self):
+                rendered.append(self.props["id"])
+                return Text(f"Count {self.state['count']}")
+
+        app = Document()[
+            div()[Counter(id="a"), Counter(id="b")],
+            div()[Counter(id="c")],
+        ]
+        app.materialize()
+        self.assertEqual(rendered, ["a", "b", "c"])
+
+        rendered.clear()
+        app.materialize()
+        self.assertEqual(rendered, [])
+        self.assertEqual(app.renderCount, 0)
+
+        counter = app.queryElement("#b")
+        counter.setState({"count": 1})
+        app.materialize()
+        self.assertEqual(rendered, ["b"])
+        # and its Text, with new props
+        self.assertEqual(app.renderCount, 2)
+        self.assertEqual(counter.children[0].props["text"], "Count 1")
+
+    def test_render_queue(self):
+        class Leaf(Component):
+            state = {"count": 0}
+
+            def render(self):
+                return f"Count {self.state['count']}"
+
+        leaf = Leaf()
+        removed = Leaf()
+        tree = div()[leaf, removed]
+        for _ in range(50):
+            tree = div()[tree]
+        app = Document()[tree]
+        app.materialize()
+
+        visited = []
+        materializeChildren = Component.materializeChildren
+
+        def trace(self):
+            visited.append(self)
+            return materializeChildren(self)
+
+        with mock.patch.object(Component, "materializeChildren", trace):
+            leaf.setState({"count": 1})
+            self.assertEqual(app.renderQueue, {leaf})
+            app.materialize()
+            # straight to the leaf, not from the document down
+            self.assertEqual(visited, [leaf, leaf.children[0]])
+
+            removed.parent.props["children"] = [leaf]
+            removed.parent.setChanged()
+            app.materialize()
+            visited.clear()
+            removed.setState({"count": 1})
+            app.materialize()
+            self.assertEqual(visited, [])
+
+    def test_render_queue_removed(self):
+        class Leaf(Component):
+            state = {"count": 0}
+            renders = 0
+
+            def render(self):
+                self.renders += 1
+                return f"Count {self.state['count']}"
+
+        class List(Component):
+            state = {"show": True}
+
+            def render(self):
+                if self.state["show"]:
+                    return div()[div()[Leaf()]]
+                return span()["Empty"]
+
+        lst = List()
+        app = Document()[lst]
+        app.materialize()
+        leaf = app.queryElement("Leaf")
+
+        with app.batch():
+            leaf.setState({"count": 1})
+            lst.setState({"show": False})
+        app.materialize()
+        # removed by the parent render, so not rendered after
+        self.assertEqual(leaf.renders, 1)
+        self.assertIsNone(app.queryElement("Leaf"))
+
+    def test_batch_updates(self):
+        class Counter(Component):
+            state = {"count": 0}
+
+            def render(self):
+                return f"Count {self.state['count']}"
+
+        counter = Counter()
+        app = Document()[counter]
+        app.materialize()
+
+        with app.batch():
+            for _ in range(10):
+                counter.setState({"count": counter.state["count"] + 1})
+            # merged at once, rendered later
+            self.assertEqual(counter.state["count"], 10)
+            self.assertEqual(app.renderQueue, set())
+        self.assertEqual(app.renderQueue, {counter})
+        app.materialize()
+        self.assertEqual(app.renderCount, 2)
+        self.assertEqual(counter.children[0].props["text"], "Count 10")
+
+    def test_dormant_queue(self):
+        class Loader(Component):
+            state = {"count": 0}
+
+            def render(self):
+                return f"Loaded {self.state['count']}"
+
+        class Tabs(Component):
+            state = {"tab": "one"}
+
+            def render(self):
+                tab = self.state["tab"]
+                return [
+                    div(dormant=tab != "one")["One"],
+                    div(dormant=tab != "two")[Loader()],
+                ]
+
+        tabs = Tabs()
+        app = Document()[tabs]
+        tabs.setState({"tab": "two"})
+        app.materialize()
+        loader = app.queryElement("Loader")
+        tabs.setState({"tab": "one"})
+        app.materialize()
+
+        loader.setState({"count": 1})
+        app.materialize()
+        # waits apart, so the loop does not keep painting
+        self.assertEqual(app.renderQueue, set())
+        self.assertEqual(app.dormantQueue, {loader})
+        self.assertEqual(loader.children[0].props["text"], "Loaded 0")
+
+        tabs.setState({"tab": "two"})
+        app.materialize()
+        self.assertEqual(app.dormantQueue, set())
+        self.assertEqual(loader.children[0].props["text"], "Loaded 1")
+
+    def test_keyed_reconcile(self):
+        class Row(Component):
+            state = {"selected": False}
+
+            def render(self):
+                return f"Row {self.props['key']}"
+
+        class List(Component):
+            state = {"keys": list(range(100))}
+
+            def render(self):
+                return div()[[Row(key=key) for key in self.state["keys"]]]
+
+        rows = List()
+        app = Document()[rows]
+        app.materialize()
+        table = rows.children[0]
+        before = {row.key: row for row in table.children}
+        before[50].setState({"selected": True})
+        app.materialize()
+
+        rows.setState({"keys": [-1, *range(100)]})
+        app.materialize()
+        # the list, the div, the new row and its text
+        self.assertEqual(app.renderCount, 4)
+        self.assertEqual([row.key for row in table.children], [-1, *range(100)])
+        for row in table.children[1:]:
+            self.assertIs(row, before[row.key])
+        self.assertTrue(before[50].state["selected"])
+
+        # reversed, and some removed
+        rows.setState({"keys": [99, 50, 10, -1]})
+        app.materialize()
+        self.assertEqual(app.renderCount, 2)
+        self.assertEqual([row.key for row in table.children], [99, 50, 10, -1])
+        self.assertIs(table.children[1], before[50])
+        self.assertTrue(table.children[1].state["selected"])
+        self.assertIsNone(before[0].document)
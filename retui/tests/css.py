@@ -1,8 +1,12 @@
-from unittest import TestCase
+import os
+import pathlib
+import tempfile
+from unittest import TestCase, mock
 
 from retui import css
+from retui.component import Component
 from retui.document import Document
-from retui.widgets import body, button, div, textarea
+from retui.widgets import body, button, div, span, textarea
 
 
 class CssTestCase(TestCase):
@@ -84,3 +88,352 @@ class CssTestCase(TestCase):
         bdy = app.queryElement("textarea")
         self.assertIsNotNone(bdy)
         self.assertEqual(bdy.getStyle("background"), "blue")
+
+    def test_rule_index(self):
+        stylesheet = css.StyleSheet()
+        stylesheet.addDict(
+            {
+                "body": {"background": "red"},
+                ".class1": {"background": "green"},
+                "#id": {"color": "blue"},
+                "div": {"color": "white"},
+                ".class2": {"background": "yellow"},
+            }
+        )
+        index = stylesheet.index
+        self.assertEqual(len(index.byElement["body"]), 1)
+        self.assertEqual(len(index.byClass["class1"]), 1)
+        self.assertEqual(len(index.byId["id"]), 1)
+
+        element = body(className="class1 class2", id="id")
+        candidates = [selector.selector for _, selector, _ in index.candidates(element)]
+        self.assertNotIn("div", candidates)
+        self.assertEqual(len(candidates), 4)
+
+        # same priority, last rule wins
+        self.assertEqual(stylesheet.getStyle(element, "background"), "yellow")
+        self.assertEqual(stylesheet.getStyle(element, "color"), "blue")
+        self.assertEqual(stylesheet.getStyle(div(), "color"), "white")
+
+    def test_computed_style_cache(self):
+        app = Document(
+            stylesheet={
+                ".red": {"background": "red"},
+                "button:focus": {"color": "blue"},
+            }
+        )[button(className="red")["Click here"], button()["Other"]]
+        app.materialize()
+        buttonel, other = app.queryElement("button"), app.children[1]
+        self.assertEqual(buttonel.getStyle("background"), "red")
+        self.assertIs(buttonel.computedStyle, buttonel.getComputedStyle())
+
+        # props change, invalidates
+        buttonel.updateProps(button(className="bg-tertiary"))
+        self.assertIsNone(buttonel.computedStyle)
+        self.assertEqual(buttonel.getStyle("background"), "bg-tertiary")
+
+        # focus change, only invalidates the focused path
+        other.getComputedStyle()
+        app.setFocus(buttonel)
+        self.assertIsNone(buttonel.computedStyle)
+        self.assertIsNotNone(other.computedStyle)
+        self.assertEqual(buttonel.getStyle("color"), "blue")
+        self.assertEqual(other.getStyle("color"), "text-secondary")
+
+    def test_computed_style_parsed(self):
+        style = {"padding": "1 2", "width": "50%", "height": 3}
+        normalized = css.StyleSheet.normalizeStyle(style)
+        self.assertNotIn("paddingTop", style)
+        self.assertEqual(normalized["paddingLeft"], 2)
+
+        computed = css.ComputedStyle(
+            {**normalized, "background": "bg-tertiary", "color": "#102030"}
+        )
+        self.assertEqual(computed.width, ("percent", 50))
+        self.assertEqual(computed.height, ("cells", 3))
+        self.assertEqual(computed.paddingTop, 1)
+        self.assertEqual(computed.paddingBottom, 1)
+        self.assertEqual(computed.background, (0xC7, 0x0A, 0x80))
+        self.assertEqual(computed.color, (0x10, 0x20, 0x30))
+        self.assertIsNone(css.parseLength("auto"))
+
+        element = div(style={"width": "50%"})
+        element.document = Document()
+        self.assertEqual(element.calculateProportion(80, element.getComputedStyle().width), 40)
+        self.assertEqual(element.getStyle("width"), "50%")
+
+    def test_inherited_cascade(self):
+        app = Document(
+            stylesheet={
+                ".red": {"color": "red"},
+                ".blue": {"color": "blue"},
+            }
+        )[
+            div(className="red", id="parent")[
+                div(id="child")[div(id="grandchild")["Text"]],
+            ],
+            div(id="other")["Other"],
+        ]
+        app.materialize()
+        app.calculateStyles()
+        parent = app.queryElement("#parent")
+        grandchild = app.queryElement("#grandchild")
+        other = app.queryElement("#other")
+        self.assertEqual(grandchild.getStyle("color"), "red")
+        self.assertEqual(grandchild.children[0].getStyle("color"), "red")
+        self.assertEqual(other.getStyle("color"), "fg")
+
+        other_style = other.computedStyle
+        parent.updateProps(div(className="blue", id="parent"))
+        self.assertTrue(app.stylesPending)
+        app.calculateStyles()
+        self.assertFalse(app.stylesPending)
+        self.assertEqual(grandchild.computedStyle.color, css.parseColor("blue"))
+        self.assertEqual(grandchild.children[0].getStyle("color"), "blue")
+        # not touched
+        self.assertIs(other.computedStyle, other_style)
+
+    def test_focus_invalidation(self):
+        app = Document()[
+            div(id="list")[
+                button(id="b1", on_click=lambda ev: None)["One"],
+                button(id="b2", on_click=lambda ev: None)["Two"],
+            ]
+        ]
+        app.materialize()
+        app.calculateStyles()
+        listel = app.queryElement("#list")
+        b1 = app.queryElement("#b1")
+        b2 = app.queryElement("#b2")
+
+        app.setFocus(b1)
+        self.assertEqual(app.focusPath, {b1, listel, app})
+        # div and document have no :focus rules
+        self.assertIsNotNone(listel.computedStyle)
+        self.assertIsNone(b1.computedStyle)
+        self.assertIsNotNone(b2.computedStyle)
+        self.assertEqual(b1.getStyle("background"), "text-secondary")
+
+        app.calculateStyles()
+        app.nextFocus()
+        self.assertIs(app.currentFocusedElement, b2)
+        self.assertIsNone(b1.computedStyle)
+        self.assertIsNone(b2.computedStyle)
+        self.assertIsNotNone(listel.computedStyle)
+        self.assertEqual(b1.getStyle("background"), "bg-secondary")
+        self.assertEqual(b2.getStyle("background"), "text-secondary")
+
+    def test_combinators(self):
+        rule = css.Selector("header > div.menu button:focus")
+        self.assertEqual(rule.element, "button")
+        self.assertEqual(rule.pseudo, ["focus"])
+        self.assertEqual(len(rule.ancestors), 2)
+        self.assertEqual(rule.ancestors[0][0], False)
+        self.assertEqual(rule.ancestors[0][1].classes, ["menu"])
+        self.assertEqual(rule.ancestors[1][0], True)
+        self.assertEqual(rule.ancestors[1][1].element, "header")
+        self.assertGreater(rule.priority, css.Selector("button:focus").priority)
+        self.assertEqual(css.Selector("div >").priority, -1)
+
+        app = Document(
+            stylesheet={
+                "div.menu button": {"color": "red"},
+                ".dark > span": {"color": "blue"},
+            }
+        )[
+            div(className="menu", id="menu")[
+                span(id="direct")[button(id="b1")["One"]],
+            ],
+            div(id="other")[button(id="b2")["Two"]],
+        ]
+        app.materialize()
+        b1 = app.queryElement("#b1")
+        b2 = app.queryElement("#b2")
+        direct = app.queryElement("#direct")
+        self.assertEqual(b1.getStyle("color"), "red")
+        self.assertNotEqual(b2.getStyle("color"), "red")
+        self.assertNotEqual(direct.getStyle("color"), "blue")
+        # rejected by the bloom filter, no need to check parents
+        self.assertNotEqual(
+            b2.getAncestorFilter() & css.bloomBits(".menu"), css.bloomBits(".menu")
+        )
+        self.assertIs(app.queryElement("div.menu button"), b1)
+
+        # ancestor changes class, descendants are restyled
+        menu = app.queryElement("#menu")
+        menu.updateProps(div(className="dark", id="menu"))
+        app.calculateStyles()
+        self.assertEqual(direct.getStyle("color"), "blue")
+        self.assertEqual(b1.getStyle("color"), "text-secondary")
+
+    def test_style_sharing(self):
+        app = Document()[
+            div()[
+                [
+                    *[
+                        button(className="w-full bg-tertiary", value=n)[str(n)]
+                        for n in range(10)
+                    ],
+                    button(className="w-full")["Other"],
+                ]
+            ]
+        ]
+        app.materialize()
+        app.calculateStyles()
+        buttons = app.children[0].children
+        shared = buttons[0].computedStyle
+        self.assertEqual(shared.values["background"], "bg-tertiary")
+        for buttonel in buttons[1:10]:
+            self.assertIs(buttonel.computedStyle, shared)
+        self.assertIsNot(buttons[10].computedStyle, shared)
+
+        # focus is part of the state, so gets its own style
+        app.setFocus(buttons[3])
+        self.assertIsNot(buttons[3].getComputedStyle(), shared)
+        self.assertEqual(buttons[3].getStyle("color"), "bg-secondary")
+        self.assertIs(buttons[4].getComputedStyle(), shared)
+
+    def test_style_sharing_bounded(self):
+        class List(Component):
+            state = {"count": 0}
+
+            def render(self):
+                # a new inline style each render
+                count = self.state["count"]
+                return [div(style={"width": 10 + count})[str(n)] for n in range(20)]
+
+        rows = List()
+        app = Document()[rows]
+        app.materialize()
+        app.calculateStyles()
+        for count in range(10):
+            rows.setState({"count": count + 1})
+            app.materialize()
+            app.calculateStyles()
+        # only the last pass, not one entry per row per render
+        self.assertLessEqual(len(rows.childStyleCache[-1]), 20)
+
+    def test_default_stylesheet_shared(self):
+        default_rules = len(css.DEFAULT_STYLESHEET.rules)
+        for _ in range(3):
+            app = Document(stylesheet={"button": {"background": "red"}})
+            self.assertIs(app.stylesheet.base, css.DEFAULT_STYLESHEET)
+            self.assertEqual(len(app.stylesheet.rules), 1)
+        self.assertEqual(len(css.DEFAULT_STYLESHEET.rules), default_rules)
+
+        with self.assertRaises(ValueError):
+            css.DEFAULT_STYLESHEET.addDict({"div": {"color": "red"}})
+
+        # same priority as the default rule, but added later
+        app = Document(stylesheet={"button": {"background": "red"}})[
+            button()["Click"]
+        ]
+        app.materialize()
+        self.assertEqual(app.queryElement("button").getStyle("background"), "red")
+        self.assertEqual(
+            app.queryElement("button").getStyle("color"), "text-secondary"
+        )
+
+    def test_css_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            cssfile = tmpdir / "theme.css"
+            cssfile.write_text(
+                """
+                /* theme */
+                button, .big {
+                    background: red;
+                    padding: 1 2;
+                }
+                header > button:focus { color: "blue"; zIndex: 2 }
+                """
+            )
+            rules = css.parseCss(cssfile.read_text())
+            self.assertEqual(
+                [x[0] for x in rules], ["button", ".big", "header > button:focus"]
+            )
+            self.assertEqual(rules[2][1], {"color": "blue", "zIndex": 2})
+
+            with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": str(tmpdir)}):
+                stylesheet = css.StyleSheet()
+                stylesheet.addFile(cssfile)
+                cached = list((tmpdir / "retui").glob("*.pickle"))
+                self.assertEqual(len(cached), 1)
+
+                # second load does not parse again
+                with mock.patch.object(css, "parseCss") as parseCss:
+                    app = Document(stylesheet=cssfile)
+                    parseCss.assert_not_called()
+
+            self.assertEqual(len(app.stylesheet.rules), 3)
+            app = app[button()["Click"]]
+            app.materialize()
+            buttonel = app.queryElement("button")
+            self.assertEqual(buttonel.getStyle("background"), "red")
+            self.assertEqual(buttonel.getStyle("paddingLeft"), 2)
+
+    def test_reload_stylesheet(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            cssfile = tmpdir / "theme.css"
+            cssfile.write_text("button { color: red; } .other { color: blue; }")
+
+            with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": str(tmpdir)}):
+                app = Document(stylesheet=cssfile)[
+                    button()["Click"], span(className="other")["Other"]
+                ]
+                app.materialize()
+                app.paint(app.renderer)
+                self.assertFalse(app.layoutPending)
+                buttonel = app.queryElement("button")
+                other = app.queryElement(".other")
+                otherStyle = other.getComputedStyle()
+                self.assertFalse(app.reloadStylesheets())
+
+                # only a color changed, just repaint
+                cssfile.write_text("button { color: green; } .other { color: blue; }")
+                os.utime(cssfile, (1, 1))
+                self.assertTrue(app.reloadStylesheets())
+                self.assertIsNone(buttonel.computedStyle)
+                self.assertIs(other.computedStyle, otherStyle)
+                self.assertEqual(buttonel.getStyle("color"), "green")
+                self.assertFalse(app.layoutPending)
+
+                # padding needs a new layout
+                cssfile.write_text("button { paddingLeft: 2; } .other { color: blue; }")
+                os.utime(cssfile, (2, 2))
+                self.assertTrue(app.reloadStylesheets())
+                app.calculateStyles()
+                self.assertTrue(app.layoutPending)
+                self.assertEqual(buttonel.getStyle("paddingLeft"), 2)
+                app.paint(app.renderer)
+                self.assertFalse(app.layoutPending)
+
+    def test_reload_reordered(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmpdir = pathlib.Path(tmpdir)
+            cssfile = tmpdir / "theme.css"
+            cssfile.write_text(
+                ".a { color: red; } .b { color: blue; } .c { color: white; }"
+            )
+
+            with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": str(tmpdir)}):
+                app = Document(stylesheet=cssfile)[
+                    span(className="a b")["Both"], span(className="c")["Other"]
+                ]
+                app.materialize()
+                app.calculateStyles()
+                both = app.queryElement(".a")
+                other = app.queryElement(".c")
+                otherStyle = other.getComputedStyle()
+                self.assertEqual(both.getStyle("color"), "blue")
+
+                # same rules, other order, so the other one wins
+                cssfile.write_text(
+                    ".b { color: blue; } .a { color: red; } .c { color: white; }"
+                )
+                os.utime(cssfile, (1, 1))
+                self.assertTrue(app.reloadStylesheets())
+                self.assertIsNone(both.computedStyle)
+                self.assertIs(other.computedStyle, otherStyle)
+                self.assertEqual(both.getStyle("color"), "red")
@@ -76,3 +76,13 @@ class EventsTestCase(TestCase):
         ev = EventMouseClick([1], (4, 1))
         app.on_event(ev)
         self.assertEqual(app.state["selected"], "menu4")
+
+    def test_split_keys(self):
+        from retui.xtermrenderer import splitKeys
+
+        data = b"ab\x1b[A\x1b[1;5C\x1b[M !!\xc3\xb1\x1b\tq"
+        self.assertEqual(
+            list(splitKeys(data)),
+            [b"a", b"b", b"\x1b[A", b"\x1b[1;5C", b"\x1b[M !!"]
+            + [b"\xc3\xb1", b"\x1b", b"\t", b"q"],
+        )
@@ -0,0 +1,76 @@
+import gc
+import unittest
+from unittest import TestCase, mock
+
+from retui import layoutstore
+from retui.component import Component, Layout
+from retui.document import Document
+from retui.layoutstore import LayoutStore, LayoutView
+from retui.widgets import div, span
+
+
+def createApp():
+    return Document()[
+        div(style={"padding": 1})[
+            [span()[f"Row {n}"] for n in range(40)],
+        ],
+        div(style={"flex-direction": "row"})[
+            [span()[f"{n}"] for n in range(40)],
+        ],
+    ]
+
+
+def layouts(app):
+    return [
+        (item.layout.x, item.layout.y, item.layout.width, item.layout.height)
+        for item in app.preorderTraversal()
+    ]
+
+
+class LayoutStoreTestCase(TestCase):
+    def test_layout_store(self):
+        app = createApp()
+        app.materialize().calculateLayout()
+        expected = layouts(app)
+        self.assertIsInstance(app.layout, Layout)
+
+        store = LayoutStore(capacity=8)
+        with mock.patch.object(Component, "layoutStore", store):
+            app = createApp()
+            app.materialize().calculateLayout()
+            self.assertIsInstance(app.layout, LayoutView)
+            self.assertEqual(layouts(app), expected)
+            # the components of the first render are not at the tree
+            self.assertGreaterEqual(len(store), len(expected))
+            self.assertGreaterEqual(store.capacity, len(store))
+
+        text = app.queryElement("Text")
+        self.assertEqual(text.layout.width, store.width[text.layout.index])
+        self.assertTrue(text.layout.inside(text.layout.x, text.layout.y))
+        # the constraints too, as measured
+        width, height = app.renderer.width, app.renderer.height
+        self.assertEqual(app.layoutConstraints, (0, 0, width, height))
+        self.assertEqual(store.maxHeight[app.layout.index], height)
+        self.assertIsNone(store.view().constraints)
+
+        # freed with the components
+        del app, text
+        gc.collect()
+        self.assertEqual(len(store), 0)
+
+    @unittest.skipUnless(layoutstore.numpy, "needs numpy")
+    def test_vectorized_positions(self):
+        app = createApp()
+        app.materialize().calculateLayout()
+        expected = layouts(app)
+
+        store = LayoutStore()
+        self.assertTrue(store.vectorize)
+        with mock.patch.object(Component, "layoutStore", store):
+            app = createApp()
+            with mock.patch.object(
+                store, "flowPositions", wraps=store.flowPositions
+            ) as flowPositions:
+                app.materialize().calculateLayout()
+        self.assertEqual(flowPositions.call_count, 2)
+        self.assertEqual(layouts(app), expected)
@@ -171,13 +171,21 @@ class input(Paintable):
 
         return (posx, posy)
 
-    def calculateLayoutSizes(self, min_width, min_height, max_width, max_height):
+    def rowConstraints(self, min_width, min_height, max_width, max_height):
         rows = self.props.get("rows", len(self.getValue().split("\n")))
         maxRows = self.maxRows()
         rows = min(rows, maxRows)
 
-        return super().calculateLayoutSizes(
-            min_width, max(min_height, rows), max_width, min(max_height, maxRows)
+        return (min_width, max(min_height, rows), max_width, min(max_height, maxRows))
+
+    def measureKey(self, min_width, min_height, max_width, max_height):
+        return super().measureKey(
+            *self.rowConstraints(min_width, min_height, max_width, max_height)
+        )
+
+    def layoutSizes(self, min_width, min_height, max_width, max_height):
+        return super().layoutSizes(
+            *self.rowConstraints(min_width, min_height, max_width, max_height)
         )
 
     def render(self):
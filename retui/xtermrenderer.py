@@ -1,4 +1,6 @@
 import os
+import re
+import select
 import shutil
 import signal
 import sys
@@ -17,6 +19,46 @@ from retui.events import (
 from .renderer import Renderer, ScreenChar
 from retui import defaults
 
+# bytes read at once, so fast typing and pastes come in a single read
+READ_SIZE = 1024
+# known escape sequences, longest first so a shorter one does not hide them
+ESCAPE_KEYCODES = sorted(
+    (code for code in defaults.XTERM_KEYCODES if code[:1] == b"\033" and code[1:]),
+    key=len,
+    reverse=True,
+)
+# any other CSI sequence, to skip it whole
+CSI_RE = re.compile(rb"\033\[[0-?]*[ -/]*[@-~]")
+
+
+def splitKeys(data: bytes):
+    """
+    Splits what was read at once into the keys and mouse events, as
+    escape sequences, control bytes and utf-8 characters.
+    """
+    pos = 0
+    size = len(data)
+    while pos < size:
+        byte = data[pos]
+        if byte == 0x1B:
+            if data.startswith(b"\033[M", pos):
+                end = pos + 6
+            else:
+                for code in ESCAPE_KEYCODES:
+                    if data.startswith(code, pos):
+                        end = pos + len(code)
+                        break
+                else:
+                    match = CSI_RE.match(data, pos)
+                    end = match.end() if match else pos + 1
+        else:
+            end = pos + 1
+            if byte >= 0x80:  # utf-8 continuation bytes
+                while end < size and 0x80 <= data[end] < 0xC0:
+                    end += 1
+        yield data[pos:end]
+        pos = end
+
 
 class XtermRenderer(Renderer):
     """
@@ -36,9 +78,11 @@ class XtermRenderer(Renderer):
 
     def update_terminal_resize(self):
         width, height = shutil.get_terminal_size()
-        self.width = width
-        self.height = height - 1
-        self.redraw()
+        if not self.document:  # at __init__, before the buffers exist
+            self.width = width
+            self.height = height - 1
+            return
+        self.resize(width, height - 1)
 
     def captureKeyboard(self, is_on):
         if is_on:
@@ -73,11 +117,23 @@ class XtermRenderer(Renderer):
 
     prev_mouse_buttons = []
 
-    def readEvents(self) -> Generator[Event, None, None]:
+    def readEvents(self, timeout: float = None) -> Generator[Event, None, None]:
+        """
+        All the events of what is available at once, so the document
+        handles all of them before the next paint.
+        """
         try:
-            key = os.read(self.stdin.fileno(), 10)
+            if timeout is not None:
+                ready, _, _ = select.select([self.stdin], [], [], timeout)
+                if not ready:
+                    return
+            data = os.read(self.stdin.fileno(), READ_SIZE)
         except KeyboardInterrupt:
             return EventExit()
+        for key in splitKeys(data):
+            yield from self.keyEvents(key)
+
+    def keyEvents(self, key: bytes) -> Generator[Event, None, None]:
         if key in defaults.XTERM_KEYCODES:
             key = defaults.XTERM_KEYCODES[key]
 
@@ -122,8 +178,12 @@ class XtermRenderer(Renderer):
 
     def rgbcolor(self, color: str):
         """
-        From any color string to the xterm ; separated color components
+        From any color string, or (r, g, b) tuple, to the xterm ; separated color components
         """
+        if isinstance(color, tuple):
+            return ";".join(map(str, color))
+        if not color:
+            return ";".join(map(str, defaults.COLORS["black"]))
         if color.startswith("#"):
             return f"{int(color[1:3], 16)};{int(color[3:5], 16)};{int(color[5:7], 16)}"
         if color in defaults.COLORS: